@@ -0,0 +1,129 @@
+"""
+Сравнение бэкендов векторизации на фиксированном наборе русских команд.
+
+Запуск: python -m bot.AI.benchmark_embeddings [--threads N] [--repeat N]
+
+Для каждого бэкенда (в отдельном процессе, чтобы честно измерить память) выводит
+время загрузки, задержку кодирования одного запроса (p50/p95), прирост RSS и
+долю команд, для которых top-1 устройство совпало с эталонным бэкендом torch.
+"""
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+DEVICES = [
+    {"id": 1, "type": "Люстра Кухня", "params": {"condition": "OFF", "brightness": "100"}},
+    {"id": 2, "type": "Люстра Гостиная", "params": {"condition": "ON", "brightness": "70"}},
+    {"id": 3, "type": "Свет Спальня", "params": {"condition": "OFF", "brightness": "40"}},
+    {"id": 4, "type": "Телевизор Гостиная", "params": {"condition": "OFF", "channel": "1", "volume": "30"}},
+    {"id": 5, "type": "Телевизор Спальня", "params": {"condition": "OFF", "channel": "5", "volume": "10"}},
+    {"id": 6, "type": "Кондиционер Кухня", "params": {"condition": "OFF", "temperature": "22"}},
+    {"id": 7, "type": "Кондиционер Спальня", "params": {"condition": "ON", "temperature": "24"}},
+    {"id": 8, "type": "Чайник", "params": {"condition": "OFF", "temperature": "100", "work_time": "2"}},
+    {"id": 9, "type": "Пылесос", "params": {"condition": "OFF", "mode": "auto"}},
+    {"id": 10, "type": "Колонка", "params": {"condition": "OFF", "volume": "50"}},
+    {"id": 11, "type": "Обогреватель Детская", "params": {"condition": "OFF", "temperature": "20"}},
+    {"id": 12, "type": "Розетка Балкон", "params": {"condition": "OFF"}},
+]
+
+COMMANDS = [
+    "включи люстру в кухне",
+    "выключи свет на кухне",
+    "люстра в гостиной",
+    "сделай свет в спальне ярче",
+    "выключи телевизор",
+    "телевизор в спальне",
+    "переключи телевизор в гостиной на пятый канал",
+    "сделай телевизор тише",
+    "кондиционер в кухне поставь 20 градусов",
+    "включи кондиционер в спальне",
+    "поставь чайник",
+    "вскипяти воду",
+    "запусти пылесос",
+    "включи уборку",
+    "сделай музыку громче",
+    "выключи колонку",
+    "включи обогреватель в детской",
+    "в детской холодно",
+    "включи розетку на балконе",
+    "выключи всё на балконе",
+]
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def _run_backend(name, threads, repeat):
+    from bot.AI.device_index import device_description
+    from bot.AI.embeddings import create_backend
+
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    backend = create_backend(name, threads=threads)
+    device_matrix = backend.encode([device_description(device) for device in DEVICES])
+    load_time = time.perf_counter() - started
+
+    backend.encode(COMMANDS[:1])  # прогрев
+
+    latencies = []
+    top1 = []
+    for _ in range(repeat):
+        for command in COMMANDS:
+            started = time.perf_counter()
+            query = backend.encode([command])[0]
+            latencies.append((time.perf_counter() - started) * 1000)
+            if len(top1) < len(COMMANDS):
+                top1.append(int(np.argmax(device_matrix @ query)))
+
+    latencies.sort()
+    return {
+        "backend": name,
+        "load_s": load_time,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "rss_mb": _rss_mb() - rss_before,
+        "top1": top1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for name in args.backends:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            results.append(pool.submit(_run_backend, name, args.threads, args.repeat).result())
+
+    reference = results[0]["top1"]
+    print(f"{'backend':<8} {'load, s':>8} {'p50, ms':>8} {'p95, ms':>8} {'RSS, MB':>8} {'top-1':>7}")
+    for result in results:
+        agreement = sum(a == b for a, b in zip(reference, result["top1"])) / len(reference)
+        print(
+            f"{result['backend']:<8} {result['load_s']:>8.1f} {result['p50_ms']:>8.1f} "
+            f"{result['p95_ms']:>8.1f} {result['rss_mb']:>8.0f} {agreement:>7.0%}"
+        )
+
+    mismatches = [
+        (command, DEVICES[a]["type"], DEVICES[b]["type"])
+        for result in results[1:]
+        for command, a, b in zip(COMMANDS, reference, result["top1"])
+        if a != b
+    ]
+    for command, expected, actual in mismatches:
+        print(f"  расхождение: '{command}': {expected} → {actual}")
+
+
+if __name__ == "__main__":
+    main()
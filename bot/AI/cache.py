@@ -0,0 +1,114 @@
+import copy
+import functools
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from bot.config import settings
+from bot.metrics import metrics
+
+
+class TTLCache:
+    """
+    Ограниченный LRU-кэш с временем жизни записей.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def normalize_text(text):
+    """
+    Нормализует команду для ключа кэша: регистр, ё, пробелы и пунктуация по краям.
+    """
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" .,!?;:")
+
+
+def devices_fingerprint(devices):
+    """
+    Отпечаток набора устройств: id, название и параметры со значениями.
+    Значения входят в промпт и нужны относительным командам ("увеличь на 10"),
+    поэтому после изменения устройства старый разбор уже не находится.
+    Возвращается сам кортеж, а не hash(): ключ кэша не должен совпадать у разных наборов.
+    """
+    return tuple(
+        (
+            device.get("id"),
+            device.get("type"),
+            tuple(sorted((key, str(value)) for key, value in (device.get("params") or {}).items())),
+        )
+        for device in devices
+    )
+
+
+extraction_cache = TTLCache(settings.LLM_CACHE_SIZE, settings.LLM_CACHE_TTL)
+
+
+def cached_extraction(func):
+    """
+    Кэширует результат функции разбора команды func(text, devices, ...) по нормализованному
+    тексту и отпечатку набора устройств. При изменении устройств пользователя
+    отпечаток меняется, и старые записи больше не находятся (вытесняются по LRU/TTL).
+    Неудачные разборы (None) не кэшируются.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(text, devices, *args, **kwargs):
+        key = (name, normalize_text(text), devices_fingerprint(devices))
+        result = extraction_cache.get(key)
+        metrics.set("llm_cache_hit_ratio", extraction_cache.hit_ratio)
+        if result is not None:
+            metrics.inc("llm_cache", result="hit", function=name)
+            return copy.deepcopy(result)
+
+        metrics.inc("llm_cache", result="miss", function=name)
+        result = await func(text, devices, *args, **kwargs)
+        if result:
+            extraction_cache.set(key, copy.deepcopy(result))
+        return result
+
+    return wrapper
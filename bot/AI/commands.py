@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from bot.config import settings
+from bot.metrics import metrics
+
+
+logger = logging.getLogger("smart_home_bot")
+
+# Типы команд, сообщения которых объединяются; добавление и удаление устройств выполняются по одному
+MERGEABLE = ("update", "chat")
+
+# Команда, которую обрабатывает текущая задача (для mark_applying)
+_current_command = ContextVar("current_command", default=None)
+
+
+class _Command:
+    def __init__(self, texts, kind, reply, discard, previous):
+        self.texts = texts
+        # Тип команды (choose_action): объединяются только изменения и общение (MERGEABLE)
+        self.kind = kind
+        self.reply = reply
+        self.discard = discard
+        # Команда пользователя, уже применявшая изменения, когда пришла эта: её нужно дождаться
+        self.previous = previous
+        self.debouncing = True
+        self.applying = False
+        self.task = None
+
+    @property
+    def text(self):
+        if self.kind == "chat" or len(self.texts) == 1:
+            return "\n".join(self.texts)
+        # Несколько команд через запятую разбираются как группа (process_device_update)
+        return ", ".join(text.strip().rstrip(".!?;,") for text in self.texts)
+
+
+def mark_applying():
+    """
+    Вызывается перед изменением устройств: с этого момента команду нельзя отменить,
+    более новая команда пользователя дождётся её завершения.
+    """
+    command = _current_command.get()
+    if command is not None:
+        command.applying = True
+
+
+class CommandTracker:
+    """
+    Текстовые и голосовые команды пользователя к AI, не более одной в работе на пользователя.
+
+    Команда ждёт окно тишины (command_debounce, для общения - chat_debounce секунд): сообщения,
+    пришедшие за это время, объединяются с ней в один запрос к LLM; команды, которые
+    не объединяются или разбираются локально (fast_path), окно не ждут. Новое сообщение во время
+    разбора (ожидание LLM или векторизации) отменяет его и запускает разбор объединённого текста:
+    результат устаревшей команды не применяется и не отправляется. Объединяются только сообщения
+    одного типа (choose_action) и только изменения устройств и общение: добавление и удаление
+    выполняются по одному. Команда, которая уже начала менять устройства (mark_applying),
+    или команда, с которой новая не объединяется, доводится до конца, а новая ждёт её.
+    Каждая объединённая или отменённая команда - сэкономленный вызов LLM (llm_calls_saved).
+    """
+
+    def __init__(self, command_debounce, chat_debounce):
+        self.command_debounce = command_debounce
+        self.chat_debounce = chat_debounce
+        # user_id -> последняя команда пользователя
+        self._commands = {}
+        self._tasks = set()
+        # Очередь обновлений (ChatQueueMiddleware), в лимитах которой идёт разбор команд
+        self._queue = None
+
+    def use_queue(self, queue):
+        """
+        Разбор и ответ команды занимают место в очереди обновлений (queue.hold): общий лимит
+        одновременной работы, место приёма и порядок с остальными обновлениями чата.
+        """
+        self._queue = queue
+
+    def submit(self, user_id, text, reply, discard=None):
+        """
+        Принимает сообщение пользователя и возвращается сразу.
+        reply(answer) - корутина отправки ответа, discard() - уборка, если сообщение поглощено более новым.
+        """
+        # llm импортирует этот модуль (mark_applying)
+        from bot.AI.llm import choose_action
+
+        texts = [text]
+        kind = choose_action(text)
+        previous = None
+        current = self._commands.get(user_id)
+        if current is not None and not current.task.done():
+            if current.applying or current.kind != kind or kind not in MERGEABLE:
+                previous = current
+            else:
+                current.task.cancel()
+                texts = current.texts + texts
+                # Отменённая команда могла ждать применяющую - новая ждёт её же
+                previous = current.previous
+                reason = "debounce" if current.debouncing else "superseded"
+                metrics.inc("llm_calls_saved", reason=reason)
+                logger.info(f"Команда пользователя {user_id} объединена с новым сообщением ({reason})")
+
+        command = _Command(texts, kind, reply, discard, previous)
+        command.task = asyncio.create_task(self._run(user_id, command))
+        self._commands[user_id] = command
+        self._tasks.add(command.task)
+        command.task.add_done_callback(self._tasks.discard)
+
+    async def _window(self, user_id, command):
+        if command.kind == "chat":
+            return self.chat_debounce
+        # Ждать сообщений для объединения незачем: команда не объединяется
+        # или разбирается локально без LLM
+        if command.kind not in MERGEABLE or self.command_debounce <= 0:
+            return 0
+        from bot.AI.llm import resolves_locally
+
+        if await resolves_locally(command.text, user_id):
+            return 0
+        return self.command_debounce
+
+    def _hold(self, user_id):
+        # Чат команды - личный чат пользователя
+        return self._queue.hold(user_id) if self._queue is not None else nullcontext()
+
+    async def _run(self, user_id, command):
+        from bot.AI.llm import process_user_input
+
+        _current_command.set(command)
+        try:
+            window = await self._window(user_id, command)
+            if window > 0:
+                await asyncio.sleep(window)
+            command.debouncing = False
+            if command.previous is not None:
+                await asyncio.wait([command.previous.task])
+            async with self._hold(user_id):
+                try:
+                    answer = await process_user_input(command.text, user_id)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки команды пользователя {user_id}: {e}")
+                    answer = "Произошла ошибка. Попробуйте позже."
+                finally:
+                    self._forget(user_id, command)
+
+                try:
+                    await command.reply(answer)
+                except Exception as e:
+                    logger.error(f"Не удалось отправить ответ пользователю {user_id}: {e}")
+        except asyncio.CancelledError:
+            if command.discard is not None:
+                await command.discard()
+            raise
+        finally:
+            self._forget(user_id, command)
+
+    def _forget(self, user_id, command):
+        if self._commands.get(user_id) is command:
+            del self._commands[user_id]
+
+    async def close(self, timeout=30):
+        """
+        Ждёт завершения принятых команд (при остановке бота).
+        """
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+
+
+command_tracker = CommandTracker(settings.COMMAND_DEBOUNCE, settings.CHAT_DEBOUNCE)
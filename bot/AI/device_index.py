@@ -0,0 +1,195 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+logger = logging.getLogger("smart_home_bot")
+
+# Насколько сходство кандидата может уступать top-1 запроса, чтобы top-1 считался неоднозначным
+ASSIGN_MARGIN = 0.02
+# Сколько пользователей держать в индексе: давно не обращавшиеся вытесняются (LRU)
+MAX_SCOPES = 10000
+
+
+def device_description(device):
+    """
+    Текстовое описание устройства, которое векторизуется для поиска: название и параметры
+    без значений - текущее состояние устройства на поиск не влияет.
+    """
+    params = device.get("params") or {}
+    return " ".join([device.get("type", ""), *map(str, params)])
+
+
+def device_fingerprint(device):
+    """
+    Отпечаток устройства по векторизуемым полям (id, type, ключи params):
+    при его изменении строку нужно перевекторизовать, а смена значений параметров её не трогает.
+    """
+    params = device.get("params") or {}
+    return (
+        device.get("id"),
+        device.get("type"),
+        tuple(sorted(str(k) for k in params)),
+    )
+
+
+class DeviceEmbeddingIndex:
+    """
+    Индекс векторов устройств по пользователям.
+    Хранит вектор каждой строки вместе с её отпечатком и пересчитывает только изменившиеся строки.
+    Поиск выполняется одним умножением матрицы устройств пользователя на вектор запроса.
+    Хранится не больше max_scopes пользователей, давно не обращавшиеся вытесняются.
+    """
+
+    def __init__(self, max_scopes=MAX_SCOPES):
+        self.max_scopes = max_scopes
+        self._lock = threading.Lock()
+        # scope -> {device_id: (fingerprint, vector)}, в порядке последнего обращения
+        self._rows = OrderedDict()
+        # scope -> (fingerprints, matrix)
+        self._matrices = {}
+        # device_id -> {scope, ...}
+        self._owners = {}
+
+    async def matrix(self, scope, devices, encode):
+        """
+        Возвращает матрицу нормированных векторов для devices (в том же порядке).
+        await encode(list[str]) -> np.ndarray вызывается только для новых или изменившихся устройств.
+        """
+        fingerprints = tuple(device_fingerprint(device) for device in devices)
+
+        with self._lock:
+            if scope in self._rows:
+                self._rows.move_to_end(scope)
+            cached = self._matrices.get(scope)
+            if cached is not None and cached[0] == fingerprints:
+                return cached[1]
+            rows = dict(self._rows.get(scope, {}))
+
+        stale = [
+            (device, fingerprint)
+            for device, fingerprint in zip(devices, fingerprints)
+            if rows.get(device.get("id"), (None,))[0] != fingerprint
+        ]
+        if stale:
+            vectors = await encode([device_description(device) for device, _ in stale])
+            for (device, fingerprint), vector in zip(stale, vectors):
+                rows[device.get("id")] = (fingerprint, np.asarray(vector, dtype=np.float32))
+            logger.debug(f"Индекс устройств {scope}: перевекторизовано {len(stale)} из {len(devices)}")
+
+        actual_ids = {device.get("id") for device in devices}
+        rows = {device_id: row for device_id, row in rows.items() if device_id in actual_ids}
+
+        if devices:
+            matrix = np.stack([rows[device.get("id")][1] for device in devices])
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        with self._lock:
+            for device_id in self._rows.get(scope, {}):
+                if device_id not in rows:
+                    self._disown(device_id, scope)
+            for device_id in rows:
+                self._owners.setdefault(device_id, set()).add(scope)
+            self._rows[scope] = rows
+            self._rows.move_to_end(scope)
+            self._matrices[scope] = (fingerprints, matrix)
+            while len(self._rows) > self.max_scopes:
+                evicted, evicted_rows = self._rows.popitem(last=False)
+                self._matrices.pop(evicted, None)
+                for device_id in evicted_rows:
+                    self._disown(device_id, evicted)
+
+        return matrix
+
+    def _disown(self, device_id, scope):
+        scopes = self._owners.get(device_id)
+        if scopes is not None:
+            scopes.discard(scope)
+            if not scopes:
+                del self._owners[device_id]
+
+    async def search(self, scope, query_vector, devices, encode):
+        """
+        Возвращает (индекс лучшего устройства, оценка) для нормированного вектора запроса.
+        """
+        matrix = await self.matrix(scope, devices, encode)
+        scores = matrix @ np.asarray(query_vector, dtype=np.float32)
+        best_idx = int(scores.argmax())
+        return best_idx, float(scores[best_idx])
+
+    async def scores(self, scope, query_vectors, devices, encode):
+        """
+        Матрица сходства (запросы x устройства) для пачки нормированных векторов запросов.
+        """
+        matrix = await self.matrix(scope, devices, encode)
+        return np.asarray(query_vectors, dtype=np.float32) @ matrix.T
+
+    async def assign(self, scope, queries, query_vectors, devices, encode, top_k=3, margin=ASSIGN_MARGIN):
+        """
+        Сопоставляет каждому запросу устройство по одной матрице сходства.
+        Каждый запрос получает свой top-1, и несколько запросов могут получить одно устройство
+        ("свет на кухне" и "кухонный свет"). Запрос переходит на другое устройство, только если
+        его top-1 занят более уверенным запросом и неоднозначен: свободный кандидат из top_k
+        уступает top-1 не больше margin ("свет в спальне" и "свет на кухне" при почти
+        одинаковом сходстве с обоими светильниками получают разные).
+        Одинаковые запросы всегда получают одно и то же устройство.
+        Возвращает список индексов устройств в порядке queries.
+        """
+        if not devices:
+            return [None] * len(queries)
+
+        scores = await self.scores(scope, query_vectors, devices, encode)
+        top_k = min(top_k, len(devices))
+
+        # Одинаковые запросы (например, несколько параметров одного устройства) разбираем как один
+        unique = {}
+        for i, query in enumerate(queries):
+            unique.setdefault(query.strip().lower(), i)
+
+        chosen = {key: int(scores[i].argmax()) for key, i in unique.items()}
+        taken = set(chosen.values())
+        holders = set()
+        # Более уверенные запросы оставляют за собой top-1 первыми
+        for key, i in sorted(unique.items(), key=lambda item: -float(scores[item[1]].max())):
+            best_idx = chosen[key]
+            if best_idx not in holders:
+                holders.add(best_idx)
+                continue
+            best = float(scores[i, best_idx])
+            for device_idx in np.argsort(-scores[i])[1:top_k]:
+                device_idx = int(device_idx)
+                if float(scores[i, device_idx]) < best - margin:
+                    break
+                if device_idx not in taken:
+                    chosen[key] = device_idx
+                    taken.add(device_idx)
+                    holders.add(device_idx)
+                    break
+
+        return [chosen[query.strip().lower()] for query in queries]
+
+    def discard(self, device_id):
+        """
+        Удаляет строку устройства из всех пользовательских индексов.
+        Вызывается сервисом устройств при добавлении или удалении устройства.
+        """
+        with self._lock:
+            for scope in self._owners.pop(device_id, set()):
+                self._rows.get(scope, {}).pop(device_id, None)
+                self._matrices.pop(scope, None)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._matrices.clear()
+            self._owners.clear()
+
+
+# Индекс устройств пользователей (scope = tg_id)
+device_index = DeviceEmbeddingIndex()
+
+# Индекс каталога устройств (для создания новых устройств)
+catalog_index = DeviceEmbeddingIndex()
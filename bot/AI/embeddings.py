@@ -0,0 +1,319 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bot.config import settings
+
+
+logger = logging.getLogger("smart_home_bot")
+
+MODEL_NAME = "intfloat/multilingual-e5-large"
+
+# Заголовок кадра: длина JSON-части (big-endian uint32)
+_HEADER = struct.Struct(">I")
+
+
+class MicroBatcher:
+    """
+    Собирает одновременные запросы на векторизацию в пачки.
+    Пачка отправляется в модель, когда набралось max_batch_size текстов
+    или истекло окно max_wait секунд с момента первого запроса.
+    Очередь ограничена max_queue запросами: при переполнении submit ждёт,
+    так что давление доходит до вызывающего кода через await.
+    """
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait=0.01, max_queue=256):
+        self._encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        # Модель не потокобезопасна и сама использует все ядра - один поток на пачку
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embeddings")
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, texts):
+        """
+        Ставит тексты в очередь и возвращает np.ndarray нормированных векторов.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(texts), future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            batch = [(texts, future) for texts, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                vectors = await loop.run_in_executor(self._executor, self._encode_batch, texts)
+            except Exception as e:
+                logger.error(f"Ошибка векторизации пачки из {len(texts)} текстов: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+class TorchBackend:
+    """
+    Модель SentenceTransformer на PyTorch в полной точности.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, threads=0):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts):
+        return np.asarray(
+            self.model.encode(texts, normalize_embeddings=True, batch_size=len(texts)),
+            dtype=np.float32,
+        )
+
+
+class OnnxBackend:
+    """
+    Квантованная (int8) модель в ONNX Runtime для хостов без GPU.
+    Файл модели готовится командой: python -m bot.AI.embeddings --export-onnx
+    """
+
+    def __init__(self, model_name=MODEL_NAME, model_path=None, threads=0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            model_path or settings.EMBEDDING_ONNX_PATH, options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self._input_names = {node.name for node in self.session.get_inputs()}
+
+    def encode(self, texts):
+        tokens = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=512, return_tensors="np"
+        )
+        inputs = {name: value.astype(np.int64) for name, value in tokens.items() if name in self._input_names}
+        hidden = self.session.run(None, inputs)[0]
+
+        # Mean pooling по маске внимания и нормировка, как в SentenceTransformer для e5
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def export_onnx(model_name=MODEL_NAME, model_path=None):
+    """
+    Экспортирует модель в ONNX и квантует веса в int8 (динамическая квантизация).
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    model_path = model_path or settings.EMBEDDING_ONNX_PATH
+    fp32_path = model_path.replace(".onnx", "-fp32.onnx")
+    os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["query: пример"], return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=17,
+        )
+    quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    logger.info(f"Квантованная модель сохранена в {model_path}")
+
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def create_backend(name=None, threads=None):
+    """
+    Создаёт бэкенд векторизации по имени (EMBEDDING_BACKEND): 'torch' или 'onnx'.
+    """
+    name = name or settings.EMBEDDING_BACKEND
+    threads = settings.EMBEDDING_THREADS if threads is None else threads
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд векторизации: {name}")
+    return BACKENDS[name](threads=threads)
+
+
+class LocalEmbedder:
+    """
+    Векторизация моделью, загруженной в текущий процесс.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or create_backend()
+        self._batcher = MicroBatcher(
+            self.backend.encode,
+            max_batch_size=settings.EMBEDDING_MAX_BATCH,
+            max_wait=settings.EMBEDDING_MAX_WAIT_MS / 1000,
+            max_queue=settings.EMBEDDING_MAX_QUEUE,
+        )
+
+    async def encode(self, texts):
+        return await self._batcher.submit(texts)
+
+    async def close(self):
+        await self._batcher.close()
+
+
+class RemoteEmbedder:
+    """
+    Клиент общего процесса векторизации (см. EmbeddingServer), доступного по unix-сокету.
+    Несколько процессов бота используют одну копию модели.
+    """
+
+    def __init__(self, socket_path=None):
+        self.socket_path = socket_path or settings.EMBEDDING_SOCKET
+
+    async def encode(self, texts):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        try:
+            await _write_frame(writer, {"texts": list(texts)})
+            header, payload = await _read_frame(reader)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+        if "error" in header:
+            raise RuntimeError(f"Сервис векторизации вернул ошибку: {header['error']}")
+        return np.frombuffer(payload, dtype=np.float32).reshape(header["shape"])
+
+    async def close(self):
+        pass
+
+
+async def _write_frame(writer, header, payload=b""):
+    data = json.dumps(header).encode()
+    writer.write(_HEADER.pack(len(data)) + data + _HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+async def _read_frame(reader):
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    header = json.loads(await reader.readexactly(size))
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    payload = await reader.readexactly(size) if size else b""
+    return header, payload
+
+
+class EmbeddingServer:
+    """
+    Отдельный процесс с моделью векторизации.
+    Запросы всех подключённых процессов бота собираются в общие пачки (MicroBatcher).
+    """
+
+    def __init__(self, embedder, socket_path=None):
+        self.embedder = embedder
+        self.socket_path = socket_path or settings.EMBEDDING_SOCKET
+
+    async def _handle(self, reader, writer):
+        try:
+            request, _ = await _read_frame(reader)
+            try:
+                vectors = await self.embedder.encode(request["texts"])
+            except Exception as e:
+                await _write_frame(writer, {"error": str(e)})
+            else:
+                await _write_frame(writer, {"shape": list(vectors.shape)}, vectors.tobytes())
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        logger.info(f"Сервис векторизации слушает {self.socket_path}")
+        async with server:
+            await server.serve_forever()
+
+
+def create_embedder():
+    """
+    Создаёт векторизатор согласно настройке EMBEDDING_MODE: 'local' или 'remote'.
+    """
+    if settings.EMBEDDING_MODE == "remote":
+        return RemoteEmbedder()
+    return LocalEmbedder()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    if "--export-onnx" in sys.argv:
+        export_onnx()
+    else:
+        asyncio.run(EmbeddingServer(LocalEmbedder()).serve())
@@ -0,0 +1,175 @@
+import logging
+import re
+
+from bot.AI.vocabulary import ON_VERBS, OFF_VERBS, SET_VERBS, RELATIVE_VERBS, PARAM_KEYWORDS
+from bot.metrics import metrics
+
+
+logger = logging.getLogger("smart_home_bot")
+
+WORD_RE = re.compile(r"[a-zа-я0-9]+")
+NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+NEGATIONS = {"не", "нет"}
+# Слова, которые не меняют смысла команды; остальные неразобранные слова отправляют команду в LLM
+FILLER_WORDS = {"пожалуйста", "плиз", "бот", "мне", "нам", "сейчас", "срочно"}
+UNIT_WORDS = ["процент", "градус"]
+# Предлоги и союзы в названиях ("Свет в спальне") не участвуют в сопоставлении
+MIN_NAME_WORD = 3
+
+
+def _words(text):
+    return WORD_RE.findall(text.lower().replace("ё", "е"))
+
+
+def _stem(word):
+    """
+    Грубая основа слова: отбрасываем окончание, чтобы "люстру" совпадало с "Люстра".
+    """
+    if len(word) <= 3:
+        return word
+    return word[:max(3, len(word) - 2)]
+
+
+def _name_stems(device):
+    return [_stem(word) for word in _words(device.get("type") or "") if len(word) >= MIN_NAME_WORD]
+
+
+def _has_verb(words, verbs):
+    return any(word.startswith(verb) for word in words for verb in verbs)
+
+
+def _match_device(words, devices):
+    """
+    Возвращает (устройство, уверенность) по совпадению основ слов названия устройства.
+    """
+    scored = []
+    for device in devices:
+        name_stems = _name_stems(device)
+        if not name_stems:
+            continue
+        matched = sum(1 for stem in name_stems if any(word.startswith(stem) for word in words))
+        if matched:
+            scored.append((matched / len(name_stems), matched, device))
+    if not scored:
+        return None, 0.0
+
+    scored.sort(key=lambda item: (-item[0], -item[1]))
+    best_score, best_matched, device = scored[0]
+    runner_score = scored[1][0] if len(scored) > 1 else 0.0
+
+    if len(scored) > 1 and scored[1][:2] == (best_score, best_matched):
+        # Несколько устройств подходят одинаково - уточнять должен LLM
+        return None, 0.0
+    if best_score == 1.0:
+        return device, 1.0
+    if runner_score == 0.0:
+        return device, 0.5 + 0.5 * best_score
+    return device, best_score - runner_score
+
+
+def _direction(words):
+    """
+    +1 или -1 для относительной команды ("увеличь на 5", "опусти на 2"), иначе 0.
+    """
+    for word in words:
+        for verb, direction in RELATIVE_VERBS.items():
+            if word.startswith(verb):
+                return direction
+    return 0
+
+
+def _shift(current, step, direction):
+    """
+    Текущее значение параметра, изменённое на step, или None, если оно не число.
+    """
+    try:
+        value = float(str(current).replace(",", ".")) + direction * float(step)
+    except ValueError:
+        return None
+    return f"{value:g}"
+
+
+def _match_param(text, words, params):
+    """
+    Возвращает (параметр, значение, уверенность) по словарю глаголов и известным ключам params.
+    """
+    text_lower = text.lower()
+    for param, keywords in PARAM_KEYWORDS.items():
+        if param in params and any(keyword in text_lower for keyword in keywords):
+            numbers = NUMBER_RE.findall(text_lower)
+            if len(numbers) == 1 and _has_verb(words, SET_VERBS + ON_VERBS):
+                value = numbers[0].replace(",", ".")
+                direction = _direction(words)
+                if direction:
+                    value = _shift(params[param], value, direction)
+                    if value is None:
+                        return None, None, 0.0
+                return param, value, 1.0
+            return None, None, 0.0
+
+    turn_on = _has_verb(words, ON_VERBS)
+    turn_off = _has_verb(words, OFF_VERBS)
+    if "condition" in params and turn_on != turn_off:
+        return "condition", "ON" if turn_on else "OFF", 1.0
+
+    return None, None, 0.0
+
+
+def _unparsed(text, words, device, param):
+    """
+    Слова команды, которые не объяснены устройством, глаголом, параметром или значением.
+    "включи кондиционер на 22" или "выключи люстру через 10 минут" значат больше, чем ON/OFF.
+    """
+    stems = _name_stems(device)
+    keywords = PARAM_KEYWORDS.get(param, [])
+    verbs = ON_VERBS + OFF_VERBS + (SET_VERBS if param != "condition" else [])
+    value_words = set(_words(" ".join(NUMBER_RE.findall(text.lower())))) if param != "condition" else set()
+    return [
+        word for word in words
+        if not (
+            word in FILLER_WORDS
+            or word in value_words
+            or (len(word) < MIN_NAME_WORD and not word.isdigit())
+            or any(word.startswith(prefix) for prefix in stems + keywords + verbs + UNIT_WORDS)
+        )
+    ]
+
+
+def parse_command(text, devices):
+    """
+    Разбирает простую команду изменения устройства без обращения к LLM.
+    Возвращает словарь {"device", "command", "value", "confidence", "target"}
+    (target - найденное устройство из devices) или None, если команда не разобрана.
+    """
+    words = _words(text)
+    if not words or NEGATIONS & set(words):
+        return None
+
+    device, device_confidence = _match_device(words, devices)
+    if device is None:
+        return None
+
+    param, value, param_confidence = _match_param(text, words, device.get("params") or {})
+    if param is None:
+        return None
+    if _unparsed(text, words, device, param):
+        return None
+
+    return {
+        "device": device.get("type"),
+        "command": param,
+        "value": value,
+        "confidence": device_confidence * param_confidence,
+        "target": device,
+    }
+
+
+def record_resolution(path):
+    """
+    Учитывает, как была разобрана команда ('fast' или 'llm'), и обновляет долю команд без LLM.
+    """
+    metrics.inc("commands_resolved", path=path)
+    fast = metrics.counter("commands_resolved", path="fast")
+    total = fast + metrics.counter("commands_resolved", path="llm")
+    metrics.set("commands_fast_path_ratio", fast / total)
+    logger.debug(f"Команда разобрана через {path}, доля без LLM: {fast / total:.0%}")
@@ -1,12 +1,19 @@
+import asyncio
 import json
 import logging
 import os
-import time
 import re
 from jsonschema import validate, ValidationError
-from langchain_groq import ChatGroq
-from sentence_transformers import SentenceTransformer, util
 
+from bot.AI.cache import cached_extraction
+from bot.AI.commands import mark_applying
+from bot.AI.device_index import device_index, catalog_index, device_description
+from bot.AI.fast_path import parse_command, record_resolution
+from bot.AI.models import ModelsNotReady, get_embedder, get_llm, is_ready, wait_ready
+from bot.AI.prompt_context import DEVICES_FORMAT, estimate_tokens, report_prompt_tokens, serialize_devices
+from bot.AI.scheduler import PRIORITY_CHAT, PRIORITY_DEVICE, CircuitOpen, QueueFull, scheduler
+from bot.AI.vocabulary import CREATE_KEYWORDS, DELETE_KEYWORDS, UPDATE_KEYWORDS
+from bot.devices.catalog import device_catalog
 from bot.devices.service import DeviceService
 from bot.users.service import UserService
 from bot.config import settings
@@ -24,58 +31,120 @@ formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-# Инициализация LLM моделей (GROQ)
-llm_reasoning = ChatGroq(model="llama3-70b-8192", temperature=0)
-
-# Инициализация модели для векторизации (RAG)
-embedding_model = SentenceTransformer("intfloat/multilingual-e5-large")
+# LLM (GROQ) и модель векторизации загружаются в фоне при старте бота (см. bot.AI.models)
 
 
 # Функции для работы с LLM (GROQ) и RAG
-def invoke_with_retry(
-        llm, prompt, chain_name, question_id, attempt_label, max_attempts=3, initial_delay=5
+def _retry_after(error):
+    """
+    Значение заголовка Retry-After из ошибки провайдера (секунды) или None.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# Сетевые ошибки клиентов провайдера без кода ответа (groq/openai и httpx), по имени класса:
+# сами клиенты загружаются лениво (bot.AI.models)
+NETWORK_ERRORS = ("APIConnectionError", "TransportError")
+
+
+def _is_rate_limited(error):
+    return getattr(error, "status_code", None) == 429 or "429" in str(error)
+
+
+def _is_provider_failure(error):
+    """
+    Ошибки, говорящие о недоступности провайдера (5xx, сетевые, таймауты), - учитываются предохранителем.
+    Остальные (4xx, ошибки в коде обработки) о доступности провайдера ничего не говорят.
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status >= 500
+    if isinstance(error, (OSError, asyncio.TimeoutError)):
+        return True
+    return any(cls.__name__ in NETWORK_ERRORS for cls in type(error).__mro__)
+
+
+async def ainvoke_with_retry(
+        llm, prompt, chain_name, question_id, attempt_label, max_attempts=3, initial_delay=5,
+        timeout=settings.LLM_TIMEOUT, priority=PRIORITY_DEVICE, max_new_tokens=100
 ):
     """
     Вызывает LLM с повторными попытками в случае ошибки (например, 429).
+    Запросы проходят через общий планировщик (лимиты RPM/TPM, приоритет, предохранитель),
+    каждый вызов ограничен таймаутом. После 429 отправка приостанавливается на Retry-After
+    (или на экспоненциально растущую задержку), не блокируя обработку остальных пользователей.
     """
     attempt = 0
     delay = initial_delay
+    estimated_tokens = estimate_tokens(prompt) + max_new_tokens
     while attempt < max_attempts:
         try:
-            result = llm.invoke(prompt).content.strip()
-            return result
+            result = await scheduler.submit(
+                lambda: asyncio.wait_for(llm.ainvoke(prompt), timeout=timeout),
+                estimated_tokens,
+                priority,
+            )
+        except (CircuitOpen, QueueFull) as e:
+            logger.error(
+                f"Chain {chain_name} для вопроса {question_id}, {attempt_label} - запрос отклонён: {e}"
+            )
+            return ""
+        except asyncio.TimeoutError:
+            scheduler.breaker.record_failure()
+            logger.info(
+                f"Chain {chain_name} для вопроса {question_id}, {attempt_label} - превышен таймаут {timeout} секунд. Повтор..."
+            )
+            attempt += 1
         except Exception as e:
-            if "429" in str(e):
+            if _is_rate_limited(e):
+                # Провайдер доступен, но и успехом ответ не считается: пауза - через retry_after
+                scheduler.breaker.release()
+                wait = _retry_after(e) or delay
                 logger.info(
-                    f"Chain {chain_name} для вопроса {question_id}, {attempt_label} - получена ошибка 429. Повтор через {delay} секунд..."
+                    f"Chain {chain_name} для вопроса {question_id}, {attempt_label} - получена ошибка 429. Повтор через {wait} секунд..."
                 )
-                time.sleep(delay)
+                scheduler.retry_after(wait)
                 delay *= 2
                 attempt += 1
             else:
+                if _is_provider_failure(e):
+                    scheduler.breaker.record_failure()
+                else:
+                    scheduler.breaker.release()
                 logger.error(
                     f"Chain {chain_name} для вопроса {question_id}, {attempt_label} - ошибка: {e}"
                 )
                 break
+        else:
+            scheduler.breaker.record_success()
+            usage = getattr(result, "usage_metadata", None) or {}
+            scheduler.record_usage(estimated_tokens, usage.get("total_tokens", estimated_tokens))
+            return result.content.strip()
     logger.error(
         f"Chain {chain_name} для вопроса {question_id}, {attempt_label} - превышено число попыток. Возвращаем пустой ответ."
     )
     return ""
 
 
-def llm_pipeline(prompt, max_new_tokens=100):
+async def allm_pipeline(prompt, max_new_tokens=100, priority=PRIORITY_DEVICE):
     """
-    Обертка для вызова LLM с использованием invoke_with_retry.
+    Асинхронная обертка для вызова LLM с использованием ainvoke_with_retry.
     Возвращает список словарей с ключом 'generated_text'.
     """
-    response = invoke_with_retry(
-        llm_reasoning,
+    response = await ainvoke_with_retry(
+        await get_llm(),
         prompt,
         "LLM Pipeline",
         "N/A",
         "attempt 1",
         max_attempts=3,
         initial_delay=5,
+        priority=priority,
+        max_new_tokens=max_new_tokens,
     )
     return [{"generated_text": response}]
 
@@ -88,37 +157,28 @@ def choose_action(text):
     - 'chat'    - обычное общение
     """
     text_lower = text.lower()
-    if any(
-            keyword in text_lower for keyword in
-            ["добавь", "создай", "новое устройство", "зарегистрируй", "подключи", "добавление"]
-    ):
+    if any(keyword in text_lower for keyword in CREATE_KEYWORDS):
         return "create"
 
-    elif any(
-            keyword in text_lower for keyword in
-            ["удали", "исключи", "убери", "стереть", "очисти", "деактивируй", "разорви связь"]
-    ):
+    elif any(keyword in text_lower for keyword in DELETE_KEYWORDS):
         return "delete"
 
-    elif any(
-            keyword in text_lower for keyword in [
-                "включи", "выключи", "поставь", "измени", "смени", "установи", "поменяй",
-                "увеличь", "уменьш", "сделай", "подними", "опусти", "открой", "закрой",
-                "запусти", "останови", "перезапусти", "прекрати", "переключи", "настрой",
-                "задай", "запрограммируй"
-            ]
-    ):
+    elif any(keyword in text_lower for keyword in UPDATE_KEYWORDS):
         return "update"
 
     else:
         return "chat"
 
-def extract_command_from_text(text, devices):
+@cached_extraction
+async def extract_command_from_text(text, devices, user_id=None):
     """
     Извлекает команду для изменения устройства.
     Использует LLM для разбора команды и возвращает JSON:
     {"device": "название устройства", "command": "изменение параметра", "value": "значение"}
+    В промпт попадают только наиболее похожие на команду устройства в компактном виде,
+    с текущими значениями параметров (для команд вроде "увеличь на 10").
     """
+    context = serialize_devices(await get_candidate_devices(text, devices, user_id), params="values")
     prompt = f"""
 Ты помощник по умному дому. Разбери команду пользователя.
 - Определи устройство и параметры.
@@ -127,8 +187,9 @@ def extract_command_from_text(text, devices):
 - Отвечай в JSON-формате:
   {{"device": "название устройства", "command": "изменение параметра", "value": "значение"}}
 
-Используй следующий список доступных девайсов для поиска схожего устройства:
-{devices}
+Используй следующий список доступных девайсов для поиска схожего устройства.
+{DEVICES_FORMAT}:
+{context}
 
 Примеры:
 - "Включи люстру в кухне" → {{"device": "Люстра Кухня", "command": "condition", "value": "ON"}}
@@ -139,7 +200,8 @@ def extract_command_from_text(text, devices):
 Никакого текста, только JSON
 Команда: {text}
     """
-    response = llm_pipeline(prompt, max_new_tokens=100)[0]["generated_text"]
+    report_prompt_tokens("extract_command_from_text", prompt, context, devices)
+    response = (await allm_pipeline(prompt, max_new_tokens=100))[0]["generated_text"]
     print(f'{response}')
     try:
         command = json.loads(response)
@@ -149,7 +211,10 @@ def extract_command_from_text(text, devices):
         return None
 
 
-def extract_creation_command_from_text(text, devices):
+async def extract_creation_command_from_text(text, devices):
+    context = serialize_devices(
+        await get_candidate_devices(text, devices, "catalog", catalog_index), params="values"
+    )
     prompt = f"""
     Ты помощник по умному дому. Твоя задача – разобрать команду пользователя для добавления нового устройства и вернуть исключительно валидный JSON-объект без каких-либо дополнительных символов или текста.
 
@@ -162,8 +227,9 @@ def extract_creation_command_from_text(text, devices):
         }}
     }}
 
-    Используй следующий список доступных девайсов для поиска схожего устройства:
-    {devices}
+    Используй следующий список доступных девайсов для поиска схожего устройства.
+    {DEVICES_FORMAT}:
+    {context}
 
     Порядок действий:
     1. Определи тип нового устройства и его параметры на основе команды.
@@ -178,8 +244,8 @@ def extract_creation_command_from_text(text, devices):
 
     Команда: {text}
     """
-
-    response = llm_pipeline(prompt, max_new_tokens=150)[0]["generated_text"]
+    report_prompt_tokens("extract_creation_command_from_text", prompt, context, devices)
+    response = (await allm_pipeline(prompt, max_new_tokens=150))[0]["generated_text"]
     try:
         command = json.loads(response)
         return command
@@ -188,12 +254,14 @@ def extract_creation_command_from_text(text, devices):
         return None
 
 
-def extract_delete_from_text(text, devices):
+@cached_extraction
+async def extract_delete_from_text(text, devices, user_id=None):
     """
     Извлекает команду для изменения устройства.
     Использует LLM для разбора команды и возвращает JSON:
     {"device": "название устройства", "command": "изменение параметра", "value": "значение"}
     """
+    context = serialize_devices(await get_candidate_devices(text, devices, user_id), params="none")
     prompt = f"""
 Ты помощник по умному дому. Найди устройство которое нужно удалить
 - Определи устройство и его id
@@ -201,8 +269,9 @@ def extract_delete_from_text(text, devices):
 - Отвечай в JSON-формате:
   {{"device": "название устройства", "id": "id"}}
 
-Используй следующий список доступных девайсов для поиска схожего устройства:
-{devices}
+Используй следующий список доступных девайсов для поиска схожего устройства.
+{DEVICES_FORMAT}:
+{context}
 
 Примеры:
 - "Удали люстру в кухне" → {{"device": "Люстра Кухня", "id": "2"}}
@@ -210,7 +279,8 @@ def extract_delete_from_text(text, devices):
 
 Команда: {text}
     """
-    response = llm_pipeline(prompt, max_new_tokens=100)[0]["generated_text"]
+    report_prompt_tokens("extract_delete_from_text", prompt, context, devices)
+    response = (await allm_pipeline(prompt, max_new_tokens=100))[0]["generated_text"]
     print(response)
     try:
         delete = json.loads(response)
@@ -220,30 +290,95 @@ def extract_delete_from_text(text, devices):
         return None
 
 
-def get_relevant_device(query, devices):
+async def encode_devices(descriptions):
+    """
+    Векторизует описания устройств (нормированные векторы для косинусного сходства).
+    """
+    return await (await get_embedder()).encode(descriptions)
+
+
+async def prepare_catalog_index(snapshot=None):
+    """
+    Заранее векторизует каталог устройств, чтобы команда создания устройства
+    не ждала кодирования всего каталога. Ждёт загрузки моделей.
+    """
+    try:
+        snapshot = snapshot or await device_catalog.get()
+        await catalog_index.matrix("catalog", snapshot.info(), encode_devices)
+    except Exception as e:
+        logger.warning(f"Векторы каталога устройств не подготовлены: {e}")
+        return
+    logger.info(f"Векторы каталога устройств готовы (версия {snapshot.version})")
+
+
+_catalog_index_task = None
+
+
+def schedule_catalog_index(snapshot=None):
+    """
+    Запускает prepare_catalog_index фоновой задачей.
+    """
+    global _catalog_index_task
+    _catalog_index_task = asyncio.get_running_loop().create_task(prepare_catalog_index(snapshot))
+    return _catalog_index_task
+
+
+def _on_catalog_reload(snapshot):
+    # Перезагруженный каталог перевекторизуем сразу, если модели уже загружены
+    if is_ready():
+        schedule_catalog_index(snapshot)
+
+
+device_catalog.on_reload(_on_catalog_reload)
+
+
+async def get_relevant_device(query, devices, user_id=None, index=device_index):
     """
     Находит наиболее релевантное устройство из списка devices на основе запроса.
-    Использует SentenceTransformer для вычисления косинусного сходства.
-    """
-    device_descriptions = []
-    for device in devices:
-        params = device.get("params", {})
-        params_str = " ".join([f"{k}:{v}" for k, v in params.items()])
-        description = f"{device.get('type', '')} {params_str}"
-        device_descriptions.append(description)
-    query_embedding = embedding_model.encode(query, convert_to_tensor=True)
-    device_embeddings = embedding_model.encode(
-        device_descriptions, convert_to_tensor=True
-    )
-    cosine_scores = util.cos_sim(query_embedding, device_embeddings)[0]
-    best_idx = int(cosine_scores.argmax())
+    Векторы устройств берутся из индекса (пересчитываются только изменившиеся),
+    сходство считается одним умножением матрицы устройств на вектор запроса.
+    """
+    if not devices:
+        return None
+    query_embedding = (await (await get_embedder()).encode([query]))[0]
+    best_idx, score = await index.search(user_id, query_embedding, devices, encode_devices)
     best_device = devices[best_idx]
     logger.info(
-        f"Найдено устройство: {best_device.get('type')} с описанием: {device_descriptions[best_idx]}"
+        f"Найдено устройство: {best_device.get('type')} с описанием: {device_description(best_device)} (score={score:.3f})"
     )
     return best_device
 
 
+async def get_candidate_devices(query, devices, user_id=None, index=device_index, top_k=None):
+    """
+    Отбирает top_k устройств, наиболее похожих на запрос (для сокращения промпта).
+    Порядок устройств сохраняется; если устройств не больше top_k, возвращает все.
+    """
+    top_k = top_k or settings.PROMPT_TOP_K
+    if len(devices) <= top_k:
+        return devices
+    query_embedding = await (await get_embedder()).encode([query])
+    scores = (await index.scores(user_id, query_embedding, devices, encode_devices))[0]
+    selected = sorted(scores.argsort()[::-1][:top_k])
+    return [devices[i] for i in selected]
+
+
+async def get_relevant_devices(queries, devices, user_id=None, index=device_index, top_k=3):
+    """
+    Находит устройства сразу для нескольких запросов (групповая команда).
+    Все запросы векторизуются одной пачкой и сравниваются с матрицей устройств за одно умножение.
+    """
+    if not queries:
+        return []
+    if not devices:
+        return [None] * len(queries)
+    query_embeddings = await (await get_embedder()).encode(list(queries))
+    indices = await index.assign(user_id, queries, query_embeddings, devices, encode_devices, top_k=top_k)
+    for query, best_idx in zip(queries, indices):
+        logger.info(f"Запрос '{query}' → устройство: {devices[best_idx].get('type')}")
+    return [devices[best_idx] for best_idx in indices]
+
+
 command_schema = {
     "type": "array",
     "items": {
@@ -259,12 +394,16 @@ command_schema = {
 }
 
 
-def extract_group_commands_from_text(text, devices):
+@cached_extraction
+async def extract_group_commands_from_text(text, devices):
     """
     Используя LLM, разбирает команду пользователя, которая может содержать инструкции для нескольких устройств.
     Ожидаемый формат ответа – список JSON-объектов вида:
     [{"device": "название устройства", "command": "имя команды", "value": "значение"}, ...]
+    Команда может касаться всех устройств, поэтому в промпт попадает весь список (в компактном виде,
+    с текущими значениями параметров).
     """
+    context = serialize_devices(devices, params="values")
     prompt = f"""
     Ты — JSON API умного дома. Разбери команду пользователя, которая может содержать инструкции для нескольких устройств.
 
@@ -301,10 +440,12 @@ def extract_group_commands_from_text(text, devices):
     {{"device": "свет на кухне", "command": "condition", "value": "OFF"}}
     ]
 
-    Доступные устройства: {devices}
+    Доступные устройства ({DEVICES_FORMAT}):
+    {context}
     Команда: {text}
     """
-    response = llm_pipeline(prompt, max_new_tokens=200)[0]["generated_text"]
+    report_prompt_tokens("extract_group_commands_from_text", prompt, context, devices)
+    response = (await allm_pipeline(prompt, max_new_tokens=200))[0]["generated_text"]
     print("Raw LLM response:\n", response)
 
     # Извлекаем JSON-массив между первым '[' и последним ']'
@@ -338,7 +479,28 @@ def extract_group_commands_from_text(text, devices):
     return commands
 
 
-async def process_device_update(text, devices):
+def _is_group(text):
+    return ("," in text) or (" и " in text) or ("все" in text) or ("кажд" in text) or ("везде" in text)
+
+
+def _fast_command(text, devices):
+    command = parse_command(text, devices)
+    if command and command["confidence"] >= settings.FAST_PATH_MIN_CONFIDENCE:
+        return command
+    return None
+
+
+async def resolves_locally(text, user_id):
+    """
+    Разберёт ли команду локальный разбор без LLM (тогда окно тишины перед ней не нужно).
+    """
+    if choose_action(text) != "update" or _is_group(text):
+        return False
+    devices = await DeviceService.get_user_devices_info(user_id)
+    return _fast_command(text, devices) is not None
+
+
+async def process_device_update(text, devices, user_id=None):
     """
     Обрабатывает команду изменения состояния устройства.
     1. Если команда содержит несколько инструкций (например, разделитель ',' или 'и'),
@@ -347,53 +509,73 @@ async def process_device_update(text, devices):
     3. Для каждой инструкции находим наиболее релевантное устройство и обновляем соответствующий параметр.
     """
     # Если в команде присутствуют разделители, предполагаем, что это группа команд
-    if ("," in text) or (" и " in text) or ("все" in text) or ("кажд" in text) or ("везде" in text):
-        group_commands = extract_group_commands_from_text(text, devices)
+    if _is_group(text):
+        group_commands = await extract_group_commands_from_text(text, devices)
         if not group_commands:
             return "Команда не распознана или устройство не найдено\nУточните девайс"
+        target_devices = await get_relevant_devices(
+            [command.get("device", "") for command in group_commands], devices, user_id
+        )
+        # Собираем все изменения и применяем их одной транзакцией
         messages = []
-        for command in group_commands:
+        changes = []
+        for command, target_device in zip(group_commands, target_devices):
             if "error" in command:
                 messages.append(command["error"])
                 continue
-            target_device = get_relevant_device(command.get("device", ""), devices)
             if not target_device:
                 messages.append("Устройство не найдено: " + command.get("device", ""))
                 continue
             param = command.get("command")
             value = command.get("value")
             if param and value is not None:
-                target_device["params"][param] = value
-                await DeviceService.update_device_state(
-                    target_device["id"], target_device["params"]
-                )
-                logger.info(
-                    f"Устройство {target_device.get('type')} обновлено: {param} = {value}"
-                )
-                messages.append(
-                    f"Устройство {target_device.get('type')} обновлено: {param} = {value}"
-                )
+                changes.append((target_device, param, value))
             else:
                 messages.append(
                     "Некорректная команда для обновления устройства: " + str(command)
                 )
+
+        # Дальше команда меняет устройства и уже не отменяется более новым сообщением
+        mark_applying()
+        updated = await DeviceService.update_devices_state(
+            [(target_device["id"], param, value) for target_device, param, value in changes]
+        )
+        for target_device, param, value in changes:
+            if target_device["id"] not in updated:
+                messages.append(f"Устройство {target_device.get('type')} не найдено")
+                continue
+            target_device["params"] = updated[target_device["id"]]
+            logger.info(
+                f"Устройство {target_device.get('type')} обновлено: {param} = {value}"
+            )
+            messages.append(
+                f"Устройство {target_device.get('type')} обновлено: {param} = {value}"
+            )
         return "\n".join(messages)
     else:
-        command = extract_command_from_text(text, devices)
-        if not command:
-            return "Команда не распознана или устройство не найдено\nУточните девайс"
-        if "error" in command:
-            return command["error"]
-        target_device = get_relevant_device(command.get("device", ""), devices)
+        # Простые команды разбираем локально, к LLM обращаемся только при низкой уверенности
+        command = _fast_command(text, devices)
+        if command:
+            record_resolution("fast")
+            target_device = command["target"]
+        else:
+            record_resolution("llm")
+            command = await extract_command_from_text(text, devices, user_id)
+            if not command:
+                return "Команда не распознана или устройство не найдено\nУточните девайс"
+            if "error" in command:
+                return command["error"]
+            target_device = await get_relevant_device(command.get("device", ""), devices, user_id)
         if not target_device:
             return "Устройство не найдено."
         param = command.get("command")
         value = command.get("value")
         if param and value is not None:
-            target_device["params"][param] = value
-            await DeviceService.update_device_state(
-                target_device["id"], target_device["params"]
-            )
+            mark_applying()
+            params = await DeviceService.patch_device_params(target_device["id"], {param: value})
+            if params is None:
+                return "Устройство не найдено."
+            target_device["params"] = params
             logger.info(
                 f"Устройство {target_device.get('type')} обновлено: {param} = {value}"
             )
@@ -411,12 +593,12 @@ async def process_device_creation(text, devices, user_id):
     2. Находит наиболее схожее устройство из локального списка для присвоения device_id.
     3. Добавляет устройство в список DEVICES.
     """
-    command = extract_creation_command_from_text(text, devices)
+    command = await extract_creation_command_from_text(text, devices)
     if not command:
         return "Команда для создания устройства не распознана."
 
     # Находим схожее устройство по имени из команды
-    similar_device = get_relevant_device(command.get("name", ""), devices)
+    similar_device = await get_relevant_device(command.get("name", ""), devices, "catalog", catalog_index)
     if not similar_device:
         return "Не удалось определить схожее устройство для создания."
 
@@ -429,7 +611,11 @@ async def process_device_creation(text, devices, user_id):
 
     user = await UserService.get_user_by_tg_id(user_id)
 
-    await DeviceService.add_llm_user_device(user.id, new_device)
+    mark_applying()
+    try:
+        await DeviceService.add_llm_user_device(user.id, new_device)
+    except ValueError as e:
+        return str(e)
 
     logger.info(
         f"Добавлено новое устройство: {new_device.get('type')} с device_id: {new_device.get('device_id')}"
@@ -437,24 +623,25 @@ async def process_device_creation(text, devices, user_id):
     return f"Добавлено новое устройство: {new_device.get('type')}"
 
 
-async def process_device_delete(text, devices):
+async def process_device_delete(text, devices, user_id=None):
     """
     Обрабатывает команду изменения состояния устройства.
     1. Извлекает команду (device, command, value) с помощью LLM.
     2. Находит наиболее релевантное устройство из списка.
     3. Обновляет соответствующий параметр в устройстве.
     """
-    delete = extract_delete_from_text(text, devices)
+    delete = await extract_delete_from_text(text, devices, user_id)
     if not delete:
         return "Команда не распознана или устройство не найдено\nУточните девайс"
     # Ищем устройство среди локальных данных
+    mark_applying()
     await DeviceService.remove_user_device(int(delete["id"]))
 
     logger.info(f"Устройство {delete['device']} удалено")
     return f"Устройство {delete['device']} удалено"
 
 
-def chat_with_bot(text):
+async def chat_with_bot(text):
     """
     Обрабатывает обычное общение с ботом: одноразовый ответ, без диалога и уточняющих вопросов.
     """
@@ -465,14 +652,15 @@ def chat_with_bot(text):
 
 Сообщение пользователя: {text}
     """
-    response = invoke_with_retry(
-        llm_reasoning,
+    response = await ainvoke_with_retry(
+        await get_llm(),
         prompt,
         "Chat",
         "N/A",
         "attempt 1",
         max_attempts=3,
         initial_delay=5,
+        priority=PRIORITY_CHAT,
     )
     return response
 
@@ -482,16 +670,22 @@ async def process_user_input(text, user_id):
     action = choose_action(text)
     logger.info(f"Определено действие: {action}")
 
+    try:
+        await wait_ready()
+    except ModelsNotReady as e:
+        logger.warning(f"Запрос пользователя {user_id} отклонён: {e}")
+        return "⏳ Бот ещё запускается, попробуйте через несколько секунд."
+
     if action == "update":
         user_devices_info = await DeviceService.get_user_devices_info(user_id)
-        result = await process_device_update(text, user_devices_info)
+        result = await process_device_update(text, user_devices_info, user_id)
     elif action == "create":
         new_devices = await DeviceService.get_all_devices_info()
         result = await process_device_creation(text, new_devices, user_id)
     elif action == "delete":
         user_devices_info = await DeviceService.get_user_devices_info(user_id)
-        result = await process_device_delete(text, user_devices_info)
+        result = await process_device_delete(text, user_devices_info, user_id)
     else:
-        result = chat_with_bot(text)
+        result = await chat_with_bot(text)
 
     return result
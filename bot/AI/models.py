@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+
+from bot.config import settings
+
+
+logger = logging.getLogger("smart_home_bot")
+
+_llm = None
+_embedder = None
+_ready = None
+_warmup_task = None
+
+
+class ModelsNotReady(Exception):
+    """
+    Модели не успели загрузиться за отведённое время.
+    """
+
+
+def _ready_event():
+    global _ready
+    if _ready is None:
+        _ready = asyncio.Event()
+    return _ready
+
+
+def _load_llm():
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(model="llama3-70b-8192", temperature=0)
+
+
+def _load_embedder():
+    from bot.AI.embeddings import create_embedder
+
+    return create_embedder()
+
+
+async def warmup():
+    """
+    Загружает LLM-клиент и модель векторизации в фоне и прогревает их пробным запросом.
+    После завершения открывает доступ к AI-обработчикам (is_ready / wait_ready).
+    """
+    global _llm, _embedder
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    try:
+        _llm = await loop.run_in_executor(None, _load_llm)
+        _embedder = await loop.run_in_executor(None, _load_embedder)
+        await _embedder.encode(["query: прогрев"])
+    except Exception as e:
+        logger.error(f"Ошибка загрузки моделей: {e}")
+        raise
+    _ready_event().set()
+    logger.info(f"Модели загружены и прогреты за {time.monotonic() - started:.1f} с")
+
+
+def start_warmup():
+    """
+    Запускает warmup фоновой задачей (один раз за процесс).
+    """
+    global _warmup_task
+    # Повторяем прогрев, если предыдущая попытка завершилась ошибкой
+    if _warmup_task is None or (_warmup_task.done() and not is_ready()):
+        _warmup_task = asyncio.get_running_loop().create_task(warmup())
+        _warmup_task.add_done_callback(_warmup_done)
+    return _warmup_task
+
+
+def _warmup_done(task):
+    # Ошибка уже залогирована в warmup; забираем её, иначе asyncio пишет "Task exception was never retrieved",
+    # а прогрев повторит следующий AI-запрос (wait_ready)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Прогрев моделей не удался, повторим при следующем AI-запросе")
+
+
+def is_ready():
+    return _ready_event().is_set()
+
+
+async def wait_ready(timeout=None):
+    """
+    Ждёт готовности моделей не дольше timeout секунд (по умолчанию MODEL_READY_TIMEOUT).
+    Если прогрев ещё не запускался, запускает его.
+    """
+    if is_ready():
+        return
+    start_warmup()
+    timeout = settings.MODEL_READY_TIMEOUT if timeout is None else timeout
+    try:
+        await asyncio.wait_for(_ready_event().wait(), timeout)
+    except asyncio.TimeoutError:
+        raise ModelsNotReady(f"Модели не загрузились за {timeout} с")
+
+
+async def get_llm():
+    await wait_ready()
+    return _llm
+
+
+async def get_embedder():
+    await wait_ready()
+    return _embedder
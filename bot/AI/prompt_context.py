@@ -0,0 +1,49 @@
+import logging
+import re
+
+from bot.metrics import metrics
+
+
+logger = logging.getLogger("smart_home_bot")
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+# Описание компактного формата для промптов
+DEVICES_FORMAT = "Формат списка: id|название|параметры (по одному устройству в строке)"
+
+
+def estimate_tokens(text):
+    """
+    Грубая оценка числа токенов: слова и знаки пунктуации.
+    Используется для сравнения размеров промптов, а не для точного подсчёта.
+    """
+    return len(TOKEN_RE.findall(text))
+
+
+def serialize_devices(devices, params="keys"):
+    """
+    Компактное представление устройств для промпта, по строке на устройство: id|название|параметры.
+    params: 'keys' - только ключи параметров, 'values' - ключи со значениями, 'none' - без параметров.
+    """
+    lines = []
+    for device in devices:
+        line = f"{device.get('id')}|{device.get('type')}"
+        device_params = device.get("params") or {}
+        if params == "keys":
+            line += "|" + ",".join(device_params)
+        elif params == "values":
+            line += "|" + ",".join(f"{k}={v}" for k, v in device_params.items())
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def report_prompt_tokens(function, prompt, context, devices):
+    """
+    Логирует и учитывает в метриках размер промпта до (repr всех устройств) и после сжатия.
+    """
+    after = estimate_tokens(prompt)
+    before = after - estimate_tokens(context) + estimate_tokens(str(devices))
+    metrics.inc("prompt_tokens_total", before, function=function, variant="raw")
+    metrics.inc("prompt_tokens_total", after, function=function, variant="compact")
+    metrics.inc("prompt_calls", function=function)
+    logger.debug(f"Промпт {function}: ~{before} → ~{after} токенов")
@@ -0,0 +1,230 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from bot.config import settings
+from bot.metrics import metrics
+
+
+logger = logging.getLogger("smart_home_bot")
+
+# Приоритеты запросов к LLM: меньше - важнее
+PRIORITY_DEVICE = 0
+PRIORITY_CHAT = 1
+
+PRIORITY_NAMES = {PRIORITY_DEVICE: "device", PRIORITY_CHAT: "chat"}
+
+
+class CircuitOpen(Exception):
+    """
+    Провайдер LLM недоступен: запросы отклоняются сразу, без ожидания.
+    """
+
+
+class QueueFull(Exception):
+    """
+    Очередь запросов к LLM переполнена.
+    """
+
+
+class TokenBucket:
+    """
+    Корзина токенов: capacity единиц, пополняется на capacity за period секунд.
+    """
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """
+        Сколько секунд ждать, пока в корзине наберётся amount единиц.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta):
+        """
+        Поправка после фактического расхода (например, реальное число токенов ответа).
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class CircuitBreaker:
+    """
+    После failure_threshold ошибок подряд размыкается на reset_timeout секунд,
+    затем пропускает один пробный запрос.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probe:
+            self._probe = True
+            return True
+        return False
+
+    def release(self):
+        """
+        Пробный запрос завершился, ничего не сказав о доступности провайдера (отменён, 429,
+        ошибка запроса): счётчик ошибок не меняется, следующий запрос снова может стать пробным.
+        """
+        self._probe = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+        metrics.set("llm_circuit_open", 0)
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            if self.opened_at is None:
+                logger.error(f"LLM недоступен: {self.failures} ошибок подряд, запросы отклоняются {self.reset_timeout} с")
+            self.opened_at = time.monotonic()
+            metrics.set("llm_circuit_open", 1)
+
+
+class LLMScheduler:
+    """
+    Единая очередь запросов к LLM с учётом лимитов провайдера.
+    Запросы ждут в очереди по приоритету (управление устройствами раньше чата),
+    пока корзины запросов в минуту и токенов в минуту позволяют отправку,
+    и не отправляются до истечения Retry-After после ответа 429.
+    """
+
+    def __init__(self, rpm, tpm, max_queue, breaker):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_queue = max_queue
+        self.breaker = breaker
+        self._queue = []
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._blocked_until = 0.0
+
+    def _update_depth(self):
+        for priority, name in PRIORITY_NAMES.items():
+            depth = sum(1 for item in self._queue if item[0] == priority)
+            metrics.set("llm_queue_depth", depth, priority=name)
+
+    def _ensure_dispatcher(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def submit(self, call, tokens, priority=PRIORITY_DEVICE):
+        """
+        Ставит вызов в очередь и возвращает его результат.
+        call - функция без аргументов, возвращающая корутину запроса к LLM.
+        tokens - оценка числа токенов запроса и ответа.
+        Исход вызова (record_success/record_failure) записывает вызывающий; если вызов
+        отменён до результата, пробное место предохранителя освобождается здесь.
+        """
+        if len(self._queue) >= self.max_queue:
+            metrics.inc("llm_requests", outcome="queue_full")
+            raise QueueFull("Очередь запросов к LLM переполнена")
+        probe = self.breaker.state != "closed"
+        if not self.breaker.allow():
+            metrics.inc("llm_requests", outcome="circuit_open")
+            raise CircuitOpen("LLM временно недоступен")
+
+        self._ensure_dispatcher()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._counter), time.monotonic(), tokens, future))
+        self._update_depth()
+        self._wakeup.set()
+
+        try:
+            await future
+            return await call()
+        except asyncio.CancelledError:
+            if probe:
+                self.breaker.release()
+            raise
+
+    def retry_after(self, seconds):
+        """
+        Приостанавливает отправку запросов на seconds секунд (заголовок Retry-After).
+        """
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        logger.info(f"Отправка запросов к LLM приостановлена на {seconds} с")
+
+    def record_usage(self, estimated, actual):
+        self.tokens.adjust(actual - estimated)
+
+    async def _dispatch(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            priority, _, enqueued_at, tokens, future = self._queue[0]
+            wait = max(
+                self._blocked_until - time.monotonic(),
+                self.requests.wait_time(1),
+                self.tokens.wait_time(tokens),
+            )
+            if wait > 0:
+                # Ждём лимит, но просыпаемся при появлении более важного запроса
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._queue)
+            self._update_depth()
+            if future.cancelled():
+                continue
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            waited = time.monotonic() - enqueued_at
+            metrics.observe("llm_queue_wait_seconds", waited, priority=PRIORITY_NAMES[priority])
+            future.set_result(None)
+
+
+scheduler = LLMScheduler(
+    rpm=settings.LLM_RPM,
+    tpm=settings.LLM_TPM,
+    max_queue=settings.LLM_QUEUE_MAX,
+    breaker=CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET),
+)
@@ -0,0 +1,34 @@
+# Словарь команд умного дома: общий для choose_action и локального разбора команд
+
+CREATE_KEYWORDS = ["добавь", "создай", "новое устройство", "зарегистрируй", "подключи", "добавление"]
+
+DELETE_KEYWORDS = ["удали", "исключи", "убери", "стереть", "очисти", "деактивируй", "разорви связь"]
+
+UPDATE_KEYWORDS = [
+    "включи", "выключи", "поставь", "измени", "смени", "установи", "поменяй",
+    "увеличь", "уменьш", "сделай", "подними", "опусти", "открой", "закрой",
+    "запусти", "останови", "перезапусти", "прекрати", "переключи", "настрой",
+    "задай", "запрограммируй"
+]
+
+# Глаголы, однозначно задающие состояние condition
+ON_VERBS = ["включи", "запусти", "открой", "перезапусти"]
+OFF_VERBS = ["выключи", "останови", "закрой", "прекрати"]
+
+# Глаголы, задающие значение параметра (значение берётся из числа в команде)
+SET_VERBS = [
+    "поставь", "измени", "смени", "установи", "поменяй", "увеличь", "уменьш",
+    "сделай", "подними", "опусти", "переключи", "настрой", "задай",
+]
+
+# Глаголы относительного изменения: число в команде - шаг от текущего значения, а не новое значение
+RELATIVE_VERBS = {"увеличь": 1, "подними": 1, "уменьш": -1, "опусти": -1}
+
+# Слова, по которым определяется ключ в UserDevices.params
+PARAM_KEYWORDS = {
+    "temperature": ["температур", "градус"],
+    "volume": ["громкост", "звук"],
+    "channel": ["канал"],
+    "brightness": ["яркост"],
+    "work_time": ["минут", "время работы"],
+}
@@ -0,0 +1,214 @@
+"""
+Пропускная способность вебхука в зависимости от числа воркеров.
+
+Запуск: python -m bot.benchmark_webhook [--workers 1 2 4] [--updates N] [--users N] [--concurrency N]
+
+Поднимает локальный сервер Bot API, который отвечает на любые методы и считает
+отправленные ботом сообщения, запускает бота (python -m bot.main) в режиме webhook
+с указанным числом воркеров и шлёт ему N обновлений "/start" от --users пользователей
+через --concurrency соединений (как Telegram, до max_connections). Время считается
+от первого обновления до последнего ответа бота, т.е. включает фоновую обработку.
+Нужна БД из настроек (.env): обновления проходят middleware и хэндлеры как обычно.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+
+SECRET = "benchmark-secret"
+TOKEN = "123456789:benchmark"
+READY_LINE = "Бот готов принимать обновления"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeBotAPI:
+    """
+    Сервер Bot API: на sendMessage возвращает сообщение, на остальные методы - true.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.expected = None
+        self.done = asyncio.Event()
+        self.webhook_set = asyncio.Event()
+        self._message_id = 0
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        if method == "setWebhook":
+            self.webhook_set.set()
+        if method == "getMe":
+            result = {"id": 123456789, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+        elif method == "sendMessage":
+            self._message_id += 1
+            self.sent += 1
+            if self.expected is not None and self.sent >= self.expected:
+                self.done.set()
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(data.get("chat_id", 0)), "type": "private"},
+                "text": data.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, port):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        return runner
+
+
+def _update(update_id, user_id):
+    user = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+async def _send_updates(url, updates, users, concurrency):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    connector = aiohttp.TCPConnector(limit=concurrency, force_close=False)
+    statuses = {}
+    queue = asyncio.Queue()
+    for update_id in range(1, updates + 1):
+        queue.put_nowait(_update(update_id, 900_000_000 + update_id % users))
+
+    async with aiohttp.ClientSession(connector=connector) as client:
+        async with client.post(url, json=_update(0, 1), headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as response:
+            assert response.status == 401, f"Неверный секрет принят: {response.status}"
+
+        async def sender():
+            while not queue.empty():
+                update = queue.get_nowait()
+                async with client.post(url, json=update, headers=headers) as response:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+    return statuses
+
+
+async def _wait_ready(process, workers):
+    ready = 0
+    while ready < workers:
+        line = await process.stderr.readline()
+        if not line:
+            raise RuntimeError("Бот завершился до готовности")
+        if READY_LINE in line.decode(errors="replace"):
+            ready += 1
+
+
+async def _wait_listening(port):
+    # Хуки запуска выполняются до того, как сервер начнёт принимать соединения
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        return
+
+
+async def _drain(stream):
+    while await stream.readline():
+        pass
+
+
+async def _run(workers, updates, users, concurrency):
+    api_port, webhook_port = _free_port(), _free_port()
+    api = FakeBotAPI()
+    runner = await api.start(api_port)
+
+    env = {
+        **os.environ,
+        "BOT_TOKEN": TOKEN,
+        "BOT_MODE": "webhook",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{api_port}",
+        "WEBHOOK_URL": f"http://127.0.0.1:{webhook_port}",
+        "WEBHOOK_SECRET": SECRET,
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(webhook_port),
+        "WEBHOOK_WORKERS": str(workers),
+        # Модели не нужны: обновления не доходят до AI
+        "EMBEDDING_MODE": "remote",
+        "EMBEDDING_SOCKET": "/nonexistent/benchmark.sock",
+        "DEVICE_WRITE_MODE": "sync",
+        # Каждое обновление должно получить ответ: отсечение флуда одного чата здесь не проверяется
+        "UPDATE_CHAT_QUEUE_MAX": str(updates),
+    }
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "bot.main", env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+    )
+    drain = None
+    try:
+        await asyncio.wait_for(_wait_ready(process, workers), 120)
+        drain = asyncio.create_task(_drain(process.stderr))
+        await asyncio.wait_for(_wait_listening(webhook_port), 30)
+        assert api.webhook_set.is_set(), "Бот не зарегистрировал вебхук"
+
+        url = f"http://127.0.0.1:{webhook_port}/webhook"
+        api.sent, api.expected = 0, updates
+        api.done.clear()
+        started = time.perf_counter()
+        statuses = await _send_updates(url, updates, users, concurrency)
+        acked = time.perf_counter() - started
+        await asyncio.wait_for(api.done.wait(), 300)
+        total = time.perf_counter() - started
+    finally:
+        process.send_signal(2)
+        try:
+            await asyncio.wait_for(process.wait(), 60)
+        except asyncio.TimeoutError:
+            process.kill()
+        await runner.cleanup()
+        if drain is not None:
+            drain.cancel()
+    return {"workers": workers, "acked_s": acked, "total_s": total, "rate": updates / total, "statuses": statuses}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=40)
+    args = parser.parse_args()
+
+    print(f"{args.updates} обновлений от {args.users} пользователей, {args.concurrency} соединений, ядер: {os.cpu_count()}")
+    print(f"{'workers':>7} {'ack, s':>8} {'total, s':>9} {'updates/s':>10}  статусы")
+    for workers in args.workers:
+        result = asyncio.run(_run(workers, args.updates, args.users, args.concurrency))
+        print(
+            f"{result['workers']:>7} {result['acked_s']:>8.2f} {result['total_s']:>9.2f} "
+            f"{result['rate']:>10.0f}  {result['statuses']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
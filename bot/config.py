@@ -14,6 +14,96 @@ class Settings(BaseSettings):
 
     GROQ_API_KEY: str
 
+    # polling - бот сам запрашивает обновления, webhook - Telegram присылает их на WEBHOOK_URL
+    BOT_MODE: str = "polling"
+    # Публичный адрес бота без пути (https://bot.example.com), путь добавляется из WEBHOOK_PATH
+    WEBHOOK_URL: str = ""
+    WEBHOOK_PATH: str = "/webhook"
+    # Секрет в заголовке X-Telegram-Bot-Api-Secret-Token (пусто - генерируется при запуске)
+    WEBHOOK_SECRET: str = ""
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    # Число процессов, принимающих обновления на одном порту (SO_REUSEPORT)
+    WEBHOOK_WORKERS: int = 1
+    # Сколько одновременных соединений Telegram открывает к вебхуку (1-100)
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+    # Свой сервер Bot API (пусто - api.telegram.org)
+    TELEGRAM_API_URL: str = ""
+
+    # Обработка обновлений: одновременно работающих хэндлеров, всего в очередях, в очереди одного чата
+    # (больше - флуд, новые обновления чата отбрасываются) и число шардов для метрик очередей
+    UPDATE_CONCURRENCY: int = 64
+    UPDATE_QUEUE_MAX: int = 1000
+    UPDATE_CHAT_QUEUE_MAX: int = 5
+    UPDATE_SHARDS: int = 16
+
+    # Окно тишины перед разбором команды (для общения - CHAT_DEBOUNCE): сообщения за это время
+    # объединяются в один запрос к LLM; 0 - без ожидания
+    COMMAND_DEBOUNCE: float = 0.5
+    CHAT_DEBOUNCE: float = 1.5
+
+    LLM_TIMEOUT: float = 30
+    # Лимиты провайдера LLM (запросы и токены в минуту) и очередь планировщика
+    LLM_RPM: int = 30
+    LLM_TPM: int = 6000
+    LLM_QUEUE_MAX: int = 100
+    # Предохранитель: после N ошибок подряд запросы отклоняются на заданное число секунд
+    LLM_BREAKER_FAILURES: int = 5
+    LLM_BREAKER_RESET: float = 30
+    # Сколько AI-запрос ждёт загрузки моделей после старта
+    MODEL_READY_TIMEOUT: float = 60
+    # Минимальная уверенность локального разбора команды, ниже - обращаемся к LLM
+    FAST_PATH_MIN_CONFIDENCE: float = 0.7
+    # Кэш результатов разбора команд LLM
+    LLM_CACHE_SIZE: int = 4096
+    LLM_CACHE_TTL: float = 6 * 60 * 60
+    # Сколько самых похожих устройств попадает в промпт
+    PROMPT_TOP_K: int = 8
+
+    # Пул соединений с БД и порог журнала медленных запросов
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_SLOW_QUERY_SECONDS: float = 0.2
+
+    # Сколько пользователей держать в кэше снимков устройств
+    DEVICE_CACHE_SIZE: int = 10000
+    # Сколько готовых экранов устройств (текст и клавиатура) держать по версиям снимков
+    DEVICE_VIEW_CACHE_SIZE: int = 10000
+    # Стоимость bcrypt (2^N итераций); при изменении хэши пересчитываются при следующем входе
+    BCRYPT_ROUNDS: int = 12
+    # Сколько паролей хэшируется одновременно (потоки вне цикла событий)
+    PASSWORD_HASH_WORKERS: int = 2
+
+    # sync - каждое изменение устройства сразу пишется в БД, write_behind - пачками (bot/devices/state_store.py)
+    DEVICE_WRITE_MODE: str = "sync"
+    DEVICE_FLUSH_INTERVAL: float = 0.5
+    DEVICE_FLUSH_MAX_BATCH: int = 500
+    # none | journal | fsync - что переживают изменения, ещё не записанные в БД
+    DEVICE_WRITE_DURABILITY: str = "journal"
+    DEVICE_WRITE_JOURNAL_DIR: str = "data/device_journal"
+
+    # Состояния диалогов (FSM) в Postgres: срок жизни брошенного диалога, кэш в процессе и период очистки
+    FSM_TTL: float = 24 * 60 * 60
+    FSM_CACHE_SIZE: int = 10000
+    FSM_CACHE_TTL: float = 60
+    FSM_CLEANUP_INTERVAL: float = 10 * 60
+
+    # Кэш tg_id -> пользователь
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: float = 5 * 60
+
+    # local - модель в процессе бота, remote - общий процесс (python -m bot.AI.embeddings)
+    EMBEDDING_MODE: str = "local"
+    EMBEDDING_SOCKET: str = "/tmp/smart_home_embeddings.sock"
+    EMBEDDING_MAX_BATCH: int = 32
+    EMBEDDING_MAX_WAIT_MS: float = 10
+    EMBEDDING_MAX_QUEUE: int = 256
+    # torch - PyTorch fp32, onnx - квантованная int8 модель в ONNX Runtime
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_PATH: str = "models/multilingual-e5-large-int8.onnx"
+    # Число потоков внутри операций модели (0 - по числу ядер)
+    EMBEDDING_THREADS: int = 0
+
     @field_validator("DATABASE_URL", mode="before")
     @classmethod
     def get_database_url(cls, v, info):
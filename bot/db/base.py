@@ -1,11 +1,83 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 from bot.config import settings
+from bot.db.instrumentation import InstrumentedPool, instrument_engine
+from bot.metrics import metrics
 
-engine =  create_async_engine(settings.DATABASE_URL)
+engine =  create_async_engine(
+    settings.DATABASE_URL,
+    poolclass=InstrumentedPool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+)
+instrument_engine(engine)
 
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Сессия unit of work текущего обновления (ставит UnitOfWorkMiddleware)
+current_session = ContextVar("current_session", default=None)
+# Счётчик выдач соединений из пула в текущем обновлении (ставит PoolCheckoutMiddleware)
+pool_checkouts = ContextVar("pool_checkouts", default=None)
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    metrics.inc("db_pool_checkouts")
+    counter = pool_checkouts.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+@asynccontextmanager
+async def use_session(session=None):
+    """
+    Сессия для метода сервиса: переданная явно, сессия текущего обновления
+    или, если её нет, новая короткая сессия.
+    """
+    session = session or current_session.get()
+    if session is not None:
+        yield session
+        return
+    async with async_session_maker() as session:
+        yield session
+
+
+async def commit(session):
+    """
+    В unit of work только отправляет изменения в БД (commit сделает middleware в конце обновления),
+    в отдельной сессии - фиксирует транзакцию.
+    """
+    if session.info.get("unit_of_work"):
+        await session.flush()
+    else:
+        await session.commit()
+
+
+def on_commit(session, callback, *args):
+    """
+    Выполняет callback после фиксации транзакции: сразу для отдельной сессии (или без сессии),
+    после commit обновления - для unit of work (при откате не выполняется).
+    """
+    if session is not None and session.info.get("unit_of_work"):
+        session.info["on_commit"].append((callback, args))
+    else:
+        callback(*args)
+
+
+def has_pending_writes(session=None):
+    """
+    Есть ли в unit of work (переданном или текущем) изменения, ещё не зафиксированные commit.
+    Пока они есть, кэши не отражают эти изменения: читать нужно из БД и класть прочитанное
+    в кэш нельзя - транзакция может откатиться.
+    """
+    session = session or current_session.get()
+    return session is not None and bool(session.info.get("on_commit"))
+
+
 class Base(DeclarativeBase):
-    pass
\ No newline at end of file
+    pass
@@ -0,0 +1,126 @@
+import functools
+import inspect
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from bot.config import settings
+from bot.metrics import metrics
+
+
+logger = logging.getLogger("smart_home_bot")
+
+# Метод сервиса, выполняющий запрос (для разбивки метрик и журнала медленных запросов)
+current_method = ContextVar("current_method", default=None)
+
+# Последние медленные запросы: читаются через recent_slow_queries()
+_slow_queries = deque(maxlen=100)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, замеряющий ожидание свободного соединения (db_pool_wait_seconds).
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe("db_pool_wait_seconds", time.perf_counter() - started)
+
+
+def _update_pool_gauges(pool, returning=0):
+    # checkin вызывается до возврата соединения в пул: оно ещё считается занятым
+    in_use = pool.checkedout() - returning
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    metrics.set("db_pool_in_use", in_use)
+    metrics.set("db_pool_saturation", in_use / capacity if capacity else 0.0)
+
+
+def instrument_engine(engine):
+    """
+    Подключает к движку замер времени и числа строк каждого запроса, журнал медленных запросов
+    и метрики занятости пула.
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        method = current_method.get() or "other"
+        metrics.observe("db_query_seconds", elapsed, method=method)
+        metrics.inc("db_statements", method=method)
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            metrics.inc("db_rows", cursor.rowcount, method=method)
+
+        if elapsed >= settings.DB_SLOW_QUERY_SECONDS:
+            metrics.inc("db_slow_queries", method=method)
+            query = " ".join(statement.split())[:500]
+            _slow_queries.append({"method": method, "seconds": elapsed, "statement": query, "at": time.time()})
+            logger.warning(f"Медленный запрос ({elapsed * 1000:.0f} мс) в {method}: {query}")
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(context):
+        # Запрос завершился ошибкой: after_cursor_execute не вызовется
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+        metrics.inc("db_errors", method=current_method.get() or "other")
+
+    @event.listens_for(sync_engine.pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        _update_pool_gauges(sync_engine.pool)
+
+    @event.listens_for(sync_engine.pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        _update_pool_gauges(sync_engine.pool, returning=1)
+
+
+def recent_slow_queries():
+    """
+    Последние запросы дольше DB_SLOW_QUERY_SECONDS (метод, длительность, текст, время).
+    """
+    return list(_slow_queries)
+
+
+def timed(name, func):
+    """
+    Оборачивает асинхронный метод сервиса: время выполнения (db_method_seconds), ошибки
+    и привязка запросов внутри метода к его имени.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_method.set(name)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            metrics.inc("db_method_errors", method=name)
+            raise
+        finally:
+            metrics.observe("db_method_seconds", time.perf_counter() - started, method=name)
+            current_method.reset(token)
+
+    return wrapper
+
+
+def instrument_service(cls):
+    """
+    Оборачивает timed все публичные асинхронные методы класса сервиса.
+    """
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("_"):
+            continue
+        if isinstance(value, (staticmethod, classmethod)) and inspect.iscoroutinefunction(value.__func__):
+            setattr(cls, attr, type(value)(timed(f"{cls.__name__}.{attr}", value.__func__)))
+    return cls
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+
+from sqlalchemy import event
+
+from bot.db.base import engine
+from bot.metrics import metrics
+
+
+logger = logging.getLogger("smart_home_bot")
+
+# Канал NOTIFY, в который триггеры таблиц users, user_sessions и user_devices сообщают об изменениях
+# (полезная нагрузка "таблица:user_id[:tg_id]"), чтобы процессы бота сбрасывали свои кэши
+CACHE_CHANNEL = "bot_cache"
+
+# pid серверных процессов Postgres для соединений этого процесса: свои изменения
+# кэши уже учли сами, уведомления о них пропускаются
+_own_backends = set()
+
+
+@event.listens_for(engine.sync_engine.pool, "connect")
+def _remember_backend(dbapi_connection, connection_record):
+    pid = dbapi_connection.driver_connection.get_server_pid()
+    connection_record.info["backend_pid"] = pid
+    _own_backends.add(pid)
+
+
+@event.listens_for(engine.sync_engine.pool, "close")
+def _forget_backend(dbapi_connection, connection_record):
+    _own_backends.discard(connection_record.info.get("backend_pid"))
+
+
+class PgListener:
+    """
+    Одно соединение с LISTEN на процесс для всех каналов NOTIFY.
+    При обрыве переподключается; после каждой подписки вызывает on_connect подписчиков,
+    чтобы они учли изменения, пропущенные, пока соединения не было.
+    """
+
+    def __init__(self):
+        # канал -> [(callback(payload), on_connect())]
+        self._subscribers = {}
+        self._task = None
+
+    def subscribe(self, channel, callback, on_connect=None):
+        self._subscribers.setdefault(channel, []).append((callback, on_connect))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def _run(self):
+        while True:
+            try:
+                async with engine.connect() as connection:
+                    raw = await connection.get_raw_connection()
+                    driver_connection = raw.driver_connection
+                    lost = asyncio.Event()
+
+                    for channel in self._subscribers:
+                        await driver_connection.add_listener(channel, self._on_notify)
+                    driver_connection.add_termination_listener(lambda _: lost.set())
+                    for subscribers in self._subscribers.values():
+                        for _, on_connect in subscribers:
+                            if on_connect is not None:
+                                on_connect()
+                    logger.info(f"Подписка на уведомления БД установлена: {', '.join(self._subscribers)}")
+                    await lost.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Подписка на уведомления БД прервана: {e}")
+            await asyncio.sleep(5)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        if pid in _own_backends:
+            return
+        metrics.inc("db_notifications", channel=channel)
+        for callback, _ in self._subscribers.get(channel, ()):
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error(f"Ошибка обработки уведомления {channel} ({payload}): {e}")
+
+
+pg_listener = PgListener()
@@ -1,28 +1,37 @@
 from sqlalchemy import insert, select
 
-from bot.db.base import async_session_maker
+from bot.db.base import commit, use_session
+from bot.db.instrumentation import instrument_service
 
 
 class BaseService:
     model = None
 
+    def __init_subclass__(cls, **kwargs):
+        # Время выполнения и запросы каждого метода сервиса попадают в метрики (bot/db/instrumentation.py)
+        super().__init_subclass__(**kwargs)
+        instrument_service(cls)
+
     @classmethod
-    async def get_by_id(cls, model_id:int):
-        async with async_session_maker() as session:
+    async def get_by_id(cls, model_id:int, session=None):
+        async with use_session(session) as session:
             query = select(cls.model).filter_by(id=model_id)
             result = await session.execute(query)
             return result.scalar_one_or_none()
 
     @classmethod
-    async def find_one_or_none(cls, **filter_by):
-        async with async_session_maker() as session:
+    async def find_one_or_none(cls, session=None, **filter_by):
+        async with use_session(session) as session:
             query = select(cls.model).filter_by(**filter_by)
             result = await session.execute(query)
             return result.scalar_one_or_none()
 
     @classmethod
-    async def add(cls, **data):
-        async with async_session_maker() as session:
+    async def add(cls, session=None, **data):
+        async with use_session(session) as session:
             query = insert(cls.model).values(**data)
             await session.execute(query)
-            await session.commit()
\ No newline at end of file
+            await commit(session)
+
+
+instrument_service(BaseService)
@@ -0,0 +1,210 @@
+import itertools
+import threading
+from collections import OrderedDict
+
+from bot.config import settings
+from bot.db.listener import CACHE_CHANNEL, pg_listener
+from bot.metrics import metrics
+
+
+class DeviceRecord:
+    """
+    Компактный снимок устройства пользователя (вместо ORM-объекта UserDevices).
+    """
+
+    __slots__ = ("id", "user_id", "device_id", "name", "params")
+
+    def __init__(self, id, user_id, device_id, name, params):
+        self.id = id
+        self.user_id = user_id
+        self.device_id = device_id
+        self.name = name
+        self.params = params
+
+    @classmethod
+    def from_model(cls, device):
+        return cls(device.id, device.user_id, device.device_id, device.name, dict(device.params or {}))
+
+    def copy(self):
+        return DeviceRecord(self.id, self.user_id, self.device_id, self.name, dict(self.params or {}))
+
+    def __repr__(self):
+        return f"DeviceRecord(id={self.id}, name={self.name!r}, params={self.params!r})"
+
+
+class DeviceSnapshotCache:
+    """
+    Кэш устройств по пользователям с вытеснением по LRU.
+    Снимок хранится по users.id, поэтому все Telegram-аккаунты (UserSession)
+    одного пользователя видят одни и те же данные. Все записи DeviceService
+    обновляют или сбрасывают снимок (write-through).
+
+    У каждого снимка есть версия: новое число при каждом изменении снимка, номера не повторяются.
+    По версии экраны устройств (bot/devices/views.py) понимают, что их можно не перестраивать.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # user_id -> {device_id: DeviceRecord}
+        self._snapshots = OrderedDict()
+        # tg_id -> user_id и обратно
+        self._sessions = {}
+        self._user_sessions = {}
+        # device_id -> user_id
+        self._owners = {}
+        # Счётчик записей: снимок, прочитанный до записи, не сохраняется
+        self._writes = 0
+        # user_id -> версия снимка (есть, только пока снимок в кэше)
+        self._versions = {}
+        self._version_counter = itertools.count(1)
+
+    def _record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.inc("device_cache", result="hit" if hit else "miss")
+        metrics.set("device_cache_hit_ratio", self.hits / (self.hits + self.misses))
+
+    def get_by_tg(self, tg_id):
+        """
+        Копии устройств пользователя по tg_id или None, если снимка нет.
+        """
+        with self._lock:
+            user_id = self._sessions.get(tg_id)
+            snapshot = self._snapshots.get(user_id) if user_id is not None else None
+            if snapshot is not None:
+                self._snapshots.move_to_end(user_id)
+            self._record(snapshot is not None)
+            if snapshot is None:
+                return None
+            return [record.copy() for record in snapshot.values()]
+
+    def get_device(self, device_id):
+        with self._lock:
+            user_id = self._owners.get(device_id)
+            snapshot = self._snapshots.get(user_id) if user_id is not None else None
+            record = snapshot.get(device_id) if snapshot is not None else None
+            self._record(record is not None)
+            return record.copy() if record is not None else None
+
+    def version_by_tg(self, tg_id):
+        """
+        Версия снимка устройств пользователя по tg_id или None, если снимка нет.
+        Берётся до чтения устройств: прочитанное тогда не старее версии.
+        """
+        with self._lock:
+            user_id = self._sessions.get(tg_id)
+            return self._versions.get(user_id) if user_id is not None else None
+
+    def version_by_device(self, device_id):
+        """
+        Версия снимка владельца устройства или None, если снимка нет.
+        """
+        with self._lock:
+            user_id = self._owners.get(device_id)
+            return self._versions.get(user_id) if user_id is not None else None
+
+    def _bump(self, user_id):
+        if user_id in self._snapshots:
+            self._versions[user_id] = next(self._version_counter)
+
+    def load_token(self):
+        """
+        Метка, которую нужно взять до чтения из БД и передать в put.
+        """
+        return self._writes
+
+    def put(self, tg_id, user_id, records, token):
+        with self._lock:
+            if token != self._writes:
+                # Пока читали из БД, устройства изменились - такой снимок может быть устаревшим
+                return
+            self._sessions[tg_id] = user_id
+            self._user_sessions.setdefault(user_id, set()).add(tg_id)
+            self._drop(user_id)
+            self._snapshots[user_id] = {record.id: record.copy() for record in records}
+            for record in records:
+                self._owners[record.id] = user_id
+            self._bump(user_id)
+            while len(self._snapshots) > self.maxsize:
+                evicted = next(iter(self._snapshots))
+                self._drop(evicted)
+                self._forget(evicted)
+
+    def patch_device(self, device_id, params):
+        """
+        Обновляет params устройства в снимке после записи в БД.
+        """
+        with self._lock:
+            self._writes += 1
+            user_id = self._owners.get(device_id)
+            snapshot = self._snapshots.get(user_id) if user_id is not None else None
+            record = snapshot.get(device_id) if snapshot is not None else None
+            if record is not None:
+                record.params = dict(params or {})
+                self._bump(user_id)
+
+    def invalidate_device(self, device_id):
+        with self._lock:
+            self._writes += 1
+            user_id = self._owners.pop(device_id, None)
+            if user_id is not None:
+                self._snapshots.get(user_id, {}).pop(device_id, None)
+                self._bump(user_id)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._writes += 1
+            self._drop(user_id)
+
+    def forget_sessions(self, user_id):
+        """
+        Сбрасывает снимок и привязки tg_id пользователя (выход из аккаунта).
+        """
+        with self._lock:
+            self._writes += 1
+            self._drop(user_id)
+            self._forget(user_id)
+
+    def on_notify(self, payload):
+        """
+        Изменение в БД из другого процесса бота: "user_devices:<user_id>" или "user_sessions:<user_id>:<tg_id>".
+        """
+        table, user_id, *_ = payload.split(":")
+        if table == "user_devices":
+            self.invalidate_user(int(user_id))
+        elif table == "user_sessions":
+            self.forget_sessions(int(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._writes += 1
+            self._snapshots.clear()
+            self._sessions.clear()
+            self._user_sessions.clear()
+            self._owners.clear()
+            self._versions.clear()
+
+    def _drop(self, user_id):
+        snapshot = self._snapshots.pop(user_id, None)
+        self._versions.pop(user_id, None)
+        for device_id in snapshot or ():
+            self._owners.pop(device_id, None)
+
+    def _forget(self, user_id):
+        for tg_id in self._user_sessions.pop(user_id, ()):
+            self._sessions.pop(tg_id, None)
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+device_cache = DeviceSnapshotCache(settings.DEVICE_CACHE_SIZE)
+# Пока подписки не было, изменения других процессов могли быть пропущены
+pg_listener.subscribe(CACHE_CHANNEL, device_cache.on_notify, on_connect=device_cache.clear)
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from types import MappingProxyType
+
+from sqlalchemy import select
+
+from bot.db.base import use_session
+from bot.db.instrumentation import current_method
+from bot.db.listener import pg_listener
+from bot.devices.model import Device
+from bot.metrics import metrics
+
+
+logger = logging.getLogger("smart_home_bot")
+
+# Канал NOTIFY, в который триггер на таблице devices сообщает об изменении каталога
+CATALOG_CHANNEL = "device_catalog"
+
+
+class CatalogDevice:
+    """
+    Неизменяемая запись каталога устройств.
+    """
+
+    __slots__ = ("id", "type", "params")
+
+    def __init__(self, id, type, params):
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "type", type)
+        object.__setattr__(self, "params", MappingProxyType(dict(params or {})))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Записи каталога устройств неизменяемы")
+
+    def default_params(self):
+        """
+        Копия параметров по умолчанию для нового устройства пользователя.
+        """
+        return dict(self.params)
+
+    def info(self):
+        return {"id": self.id, "type": self.type, "params": dict(self.params)}
+
+    def __repr__(self):
+        return f"CatalogDevice(id={self.id}, type={self.type!r})"
+
+
+class CatalogSnapshot:
+    """
+    Загруженный каталог: устройства по порядку id и поиск по id и по названию.
+    """
+
+    def __init__(self, version, devices):
+        self.version = version
+        self.devices = tuple(devices)
+        self.by_id = {device.id: device for device in self.devices}
+        self.by_type = {device.type.lower(): device for device in self.devices}
+
+    def get(self, device_id):
+        return self.by_id.get(device_id)
+
+    def find(self, device_type):
+        return self.by_type.get(device_type.strip().lower())
+
+    def info(self):
+        """
+        Каталог в виде словарей {"id", "type", "params"} для LLM и индекса векторов.
+        """
+        return [device.info() for device in self.devices]
+
+
+class DeviceCatalog:
+    """
+    Каталог устройств в памяти процесса. Загружается одним запросом при первом обращении
+    и перезагружается, когда меняется версия: invalidate() увеличивает её локально,
+    а слушатель LISTEN/NOTIFY (bot/db/listener.py) - при изменении таблицы devices другими процессами.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._version = 0
+        self._lock = None
+        self._listeners = []
+
+    async def get(self, session=None) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version:
+            return snapshot
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == self._version:
+                return snapshot
+
+            version = self._version
+            token = current_method.set("DeviceCatalog.load")
+            try:
+                async with use_session(session) as session:
+                    result = await session.execute(select(Device).order_by(Device.id))
+                    devices = [CatalogDevice(device.id, device.type, device.params) for device in result.scalars()]
+            finally:
+                current_method.reset(token)
+
+            self._snapshot = CatalogSnapshot(version, devices)
+            metrics.inc("device_catalog_loads")
+            logger.info(f"Каталог устройств загружен: {len(devices)} шт., версия {version}")
+
+        for listener in self._listeners:
+            listener(self._snapshot)
+        return self._snapshot
+
+    def invalidate(self):
+        self._version += 1
+
+    def on_reload(self, callback):
+        """
+        Регистрирует callback(snapshot), вызываемый после каждой загрузки каталога.
+        """
+        self._listeners.append(callback)
+
+    def _on_notify(self, payload):
+        logger.info("Каталог устройств изменён, будет перезагружен")
+        self.invalidate()
+
+
+device_catalog = DeviceCatalog()
+# Изменения, пропущенные до подписки (или пока соединения не было), тоже приводят к перезагрузке
+pg_listener.subscribe(CATALOG_CHANNEL, device_catalog._on_notify, on_connect=device_catalog.invalidate)
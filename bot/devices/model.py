@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from bot.db.base import Base
 import copy
@@ -8,18 +9,21 @@ class Device(Base):
 
     id = Column(Integer, primary_key=True)
     type = Column(String, unique=True, nullable=False)
-    params = Column(JSON, nullable=True)
+    params = Column(JSONB, nullable=True)
 
     #пример params: {'brightness': "100%"} или {"voltage": "220"}
 
 class UserDevices(Base):
     __tablename__ = "user_devices"
+    __table_args__ = (
+        UniqueConstraint("user_id", "name", name="uq_user_devices_user_id_name"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    device_id = Column(Integer, ForeignKey("devices.id"), nullable=False)
+    device_id = Column(Integer, ForeignKey("devices.id"), nullable=False, index=True)
     name = Column(String, nullable=False)
-    params = Column(JSON, nullable=True)
+    params = Column(JSONB, nullable=True)
 
     user = relationship("User", backref="user_devices")
     device = relationship("Device", backref="user_devices")
@@ -1,10 +1,15 @@
 import json
 
-from sqlalchemy import select
+from sqlalchemy import case, func, literal, select, update
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.exc import IntegrityError
 
-from bot.db.base import async_session_maker
+from bot.AI.device_index import device_index
+from bot.db.base import commit, current_session, has_pending_writes, on_commit, use_session
+from bot.devices.cache import DeviceRecord, device_cache
+from bot.devices.catalog import CatalogDevice, device_catalog
 from bot.devices.model import Device, UserDevices
+from bot.devices.state_store import patch_query, state_store
 from bot.users.model import UserSession
 from bot.db.service import BaseService
 
@@ -12,114 +17,268 @@ class DeviceService(BaseService):
     model = Device
 
     @staticmethod
-    async def get_available_devices():
-        async with async_session_maker() as session:
-            result = await session.execute(select(Device))
-            return result.scalars().all()
+    async def get_available_devices(session=None) -> tuple[CatalogDevice, ...]:
+        catalog = await device_catalog.get(session)
+        return catalog.devices
 
     @staticmethod
-    async def get_user_devices(tg_id: int):
-        async with async_session_maker() as session:
+    async def get_user_devices(tg_id: int, session=None) -> list[DeviceRecord]:
+        """
+        Устройства пользователя по tg_id из кэша снимков, при промахе - одним запросом к БД.
+        """
+        cached = not has_pending_writes(session)
+        devices = device_cache.get_by_tg(tg_id) if cached else None
+        if devices is not None:
+            return state_store.overlay(devices)
+
+        token = device_cache.load_token()
+        async with use_session(session) as session:
             query = (
-                select(UserDevices)
-                .join(UserSession, UserDevices.user_id == UserSession.user_id)
+                select(UserSession.user_id, UserDevices)
+                .outerjoin(UserDevices, UserDevices.user_id == UserSession.user_id)
                 .filter(UserSession.tg_id == tg_id)
+                .order_by(UserDevices.id)
             )
             result = await session.execute(query)
+            rows = result.all()
 
-            return result.scalars().all()
+        if not rows:
+            return []
+        devices = [DeviceRecord.from_model(device) for _, device in rows if device is not None]
+        if cached:
+            device_cache.put(tg_id, rows[0][0], devices, token)
+        return state_store.overlay(devices)
 
     @staticmethod
-    async def get_device_by_id(device_id: int):
-        async with async_session_maker() as session:
-            query = select(Device).filter(Device.id == device_id)
-            result = await session.execute(query)
-            return result.scalar_one_or_none()
+    async def get_device_by_id(device_id: int, session=None) -> CatalogDevice | None:
+        catalog = await device_catalog.get(session)
+        return catalog.get(device_id)
 
     @staticmethod
-    async def get_my_device_by_id(device_id: int):
-        async with async_session_maker() as session:
-            query = select(UserDevices).filter_by(id = device_id)
-            result = await session.execute(query)
-            return result.scalar_one_or_none()
+    async def get_my_device_by_id(device_id: int, session=None) -> DeviceRecord | None:
+        device = device_cache.get_device(device_id) if not has_pending_writes(session) else None
+        if device is None:
+            async with use_session(session) as session:
+                query = select(UserDevices).filter_by(id = device_id)
+                result = await session.execute(query)
+                device = result.scalar_one_or_none()
+            if device is None:
+                return None
+            device = DeviceRecord.from_model(device)
+        return state_store.overlay([device])[0]
 
     @staticmethod
-    async def get_default_params(device_id: int):
-        async with async_session_maker() as session:
-            query = select(Device.params).filter_by(id = device_id)
-            result = await session.execute(query)
-            return result.scalar_one_or_none()
+    async def get_default_params(device_id: int, session=None):
+        device = await DeviceService.get_device_by_id(device_id, session)
+        return device.default_params() if device else None
 
     @staticmethod
-    async def add_user_device(user_id: int, device_id: int, name: str):
-        async with async_session_maker() as session:
-            default_params = await DeviceService.get_default_params(device_id)
+    async def add_user_device(user_id: int, device_id: int, name: str, session=None):
+        async with use_session(session) as session:
+            default_params = await DeviceService.get_default_params(device_id, session)
             new_device = UserDevices(user_id=user_id, device_id=device_id, name=name, params=default_params)
-            session.add(new_device)
-            try:
-                await session.commit()
-            except IntegrityError:
-                await session.rollback()
-                raise ValueError("❌ Устройство с таким именем уже добавлено.")
+            await DeviceService._insert_user_device(session, new_device)
 
     @staticmethod
-    async def add_llm_user_device(user_id: int, device: dict):
-        async with async_session_maker() as session:
-
+    async def add_llm_user_device(user_id: int, device: dict, session=None):
+        async with use_session(session) as session:
             new_device = UserDevices(user_id=user_id, device_id=device["device_id"], name=device["type"], params=device["params"])
-            session.add(new_device)
-            await session.commit()
+            await DeviceService._insert_user_device(session, new_device)
 
     @staticmethod
-    async def update_device_state(device_id: int, params: dict):
-        async with async_session_maker() as session:
-            query = select(UserDevices).filter_by(id=device_id)
+    async def _insert_user_device(session, new_device: UserDevices):
+        # Вставка в точке сохранения: при дубликате названия откатывается только она, а не вся транзакция обновления
+        try:
+            async with session.begin_nested():
+                session.add(new_device)
+        except IntegrityError:
+            raise ValueError("❌ Устройство с таким именем уже добавлено.")
+        await commit(session)
+        on_commit(session, DeviceService._forget_user_devices, new_device.id, new_device.user_id)
+
+    @staticmethod
+    def _forget_user_devices(device_id: int, user_id: int):
+        device_index.discard(device_id)
+        device_cache.invalidate_user(user_id)
+
+    @staticmethod
+    def _apply_params(device_id: int, params: dict):
+        # Индекс векторов сам заметит новые ключи params по отпечатку, значения в него не входят
+        device_cache.patch_device(device_id, params)
+
+    @staticmethod
+    def _forget_device(device_id: int):
+        device_index.discard(device_id)
+        device_cache.invalidate_device(device_id)
+        state_store.forget(device_id)
+
+    @staticmethod
+    async def _load_state(device_id: int, session=None) -> dict | None:
+        """
+        Текущие params устройства для отложенной записи: из памяти, иначе из кэша или БД.
+        """
+        if state_store.get(device_id) is None:
+            device = await DeviceService.get_my_device_by_id(device_id, session)
+            if device is None:
+                return None
+            state_store.remember(device_id, device.params)
+        return state_store.get(device_id)
+
+    @staticmethod
+    async def _write_behind(device_id: int, patch: dict, session=None, replace=False) -> dict | None:
+        """
+        Изменение в режиме отложенной записи: применяется в памяти после фиксации транзакции
+        обновления (в unit of work - после его commit, при откате не применяется), в БД - пачкой позже.
+        Возвращает новые params или None, если устройство не найдено.
+        """
+        params = await DeviceService._load_state(device_id, session)
+        if params is None:
+            return None
+        on_commit(session or current_session.get(), DeviceService._apply_state, device_id, patch, replace)
+        return dict(patch) if replace else {**params, **patch}
+
+    @staticmethod
+    def _apply_state(device_id: int, patch: dict, replace=False):
+        params = state_store.apply(device_id, patch, replace=replace)
+        DeviceService._apply_params(device_id, params)
+
+    @staticmethod
+    async def update_device_state(device_id: int, params: dict, session=None):
+        """
+        Полностью заменяет params устройства одним UPDATE.
+        """
+        if state_store.enabled:
+            await DeviceService._write_behind(device_id, params, session, replace=True)
+            return
+
+        async with use_session(session) as session:
+            query = (
+                update(UserDevices)
+                .where(UserDevices.id == device_id)
+                .values(params=params)
+                .returning(UserDevices.id)
+            )
             result = await session.execute(query)
-            device = result.scalars().first()
+            updated = result.scalar_one_or_none()
+            await commit(session)
 
-            if device:
-                device.params = params
-                await session.commit()
+            if updated is not None:
+                on_commit(session, DeviceService._apply_params, device_id, params)
 
     @staticmethod
-    async def update_device_params(device_id: int, param: dict):
-        async with async_session_maker() as session:
-            query = select(UserDevices).filter_by(id=device_id)
+    async def patch_device_params(device_id: int, patch: dict, session=None) -> dict | None:
+        """
+        Атомарно меняет отдельные ключи params одним UPDATE на стороне БД (без предварительного SELECT).
+        Возвращает новый params или None, если устройство не найдено.
+        """
+        if state_store.enabled:
+            return await DeviceService._write_behind(device_id, patch, session)
+
+        current = func.coalesce(UserDevices.params, func.jsonb_build_object())
+        query = (
+            update(UserDevices)
+            .where(UserDevices.id == device_id)
+            .values(params=current.op("||")(literal(patch, JSONB)))
+            .returning(UserDevices.params)
+        )
+        async with use_session(session) as session:
             result = await session.execute(query)
-            device = result.scalars().first()
+            params = result.scalar_one_or_none()
+            await commit(session)
 
-            device.params[param['name']] = param['value']
-            await session.commit()
+            if params is not None:
+                on_commit(session, DeviceService._apply_params, device_id, params)
+        return params
 
     @staticmethod
-    async def remove_user_device(device_id: int):
-        async with async_session_maker() as session:
+    async def toggle_device_condition(device_id: int, session=None) -> dict | None:
+        """
+        Атомарно переключает condition (ON <-> OFF) на стороне БД.
+        Возвращает новый params или None, если устройство не найдено.
+        """
+        if state_store.enabled:
+            params = await DeviceService._load_state(device_id, session)
+            if params is None:
+                return None
+            # Обновления чата идут по очереди, а изменение применяется к памяти при commit обновления:
+            # следующее нажатие прочитает уже новое состояние
+            new_state = "OFF" if params.get("condition") == "ON" else "ON"
+            return await DeviceService._write_behind(device_id, {"condition": new_state}, session)
+
+        current = func.coalesce(UserDevices.params, func.jsonb_build_object())
+        new_state = case((UserDevices.params["condition"].astext == "ON", "OFF"), else_="ON")
+        query = (
+            update(UserDevices)
+            .where(UserDevices.id == device_id)
+            .values(params=current.op("||")(func.jsonb_build_object("condition", new_state)))
+            .returning(UserDevices.params)
+        )
+        async with use_session(session) as session:
+            result = await session.execute(query)
+            params = result.scalar_one_or_none()
+            await commit(session)
+
+            if params is not None:
+                on_commit(session, DeviceService._apply_params, device_id, params)
+        return params
+
+    @staticmethod
+    async def update_devices_state(changes: list[tuple[int, str, str]], session=None) -> dict[int, dict]:
+        """
+        Применяет пачку изменений (id устройства, параметр, значение) одним UPDATE в одной транзакции.
+        Изменения одного устройства объединяются, новые значения сливаются с params на стороне БД.
+        Возвращает {id устройства: новые params} для найденных устройств.
+        """
+        patches = {}
+        for device_id, param, value in changes:
+            patches.setdefault(device_id, {})[param] = value
+        if not patches:
+            return {}
+
+        if state_store.enabled:
+            updated = {}
+            for device_id, patch in patches.items():
+                params = await DeviceService._write_behind(device_id, patch, session)
+                if params is not None:
+                    updated[device_id] = params
+            return updated
+
+        async with use_session(session) as session:
+            result = await session.execute(patch_query(patches))
+            updated = {device_id: params for device_id, params in result.all()}
+            await commit(session)
+
+            for device_id, params in updated.items():
+                on_commit(session, DeviceService._apply_params, device_id, params)
+        return updated
+
+    @staticmethod
+    async def update_device_params(device_id: int, param: dict, session=None):
+        return await DeviceService.patch_device_params(device_id, {param['name']: param['value']}, session)
+
+    @staticmethod
+    async def remove_user_device(device_id: int, session=None):
+        async with use_session(session) as session:
             query = select(UserDevices).filter_by(id=device_id)
             result = await session.execute(query)
             user_device = result.scalars().first()
 
             if user_device:
                 await session.delete(user_device)
-                await session.commit()
+                await commit(session)
+                on_commit(session, DeviceService._forget_device, device_id)
                 return True
             else:
                 return False
 
     @staticmethod
-    async def get_all_devices_info():
-        devices = await DeviceService.get_available_devices()
-        devices_info = []
-        for device in devices:
-            devices_info.append({
-                'id': device.id,
-                'type': device.type,
-                'params': device.params
-            })
-        return devices_info
+    async def get_all_devices_info(session=None):
+        catalog = await device_catalog.get(session)
+        return catalog.info()
 
     @staticmethod
-    async def get_user_devices_info(tg_id: int):
-        devices = await DeviceService.get_user_devices(tg_id)
+    async def get_user_devices_info(tg_id: int, session=None):
+        devices = await DeviceService.get_user_devices(tg_id, session)
         devices_info = []
         for device in devices:
             devices_info.append({
@@ -0,0 +1,318 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from sqlalchemy import Integer, column, func, update, values
+from sqlalchemy.dialects.postgresql import JSONB
+
+from bot.config import settings
+from bot.db.base import async_session_maker
+from bot.db.instrumentation import current_method
+from bot.devices.cache import device_cache
+from bot.devices.model import UserDevices
+from bot.metrics import metrics
+
+
+logger = logging.getLogger("smart_home_bot")
+
+JOURNAL_PREFIX = "journal."
+
+
+def patch_query(patches: dict[int, dict], replace=False):
+    """
+    Один UPDATE ... FROM (VALUES ...) для {id устройства: params}.
+    replace=False - новые значения сливаются с params на стороне БД, True - params заменяются целиком.
+    Возвращает (id, params) обновлённых устройств.
+    """
+    patch_table = values(
+        column("id", Integer), column("patch", JSONB), name="patch"
+    ).data(list(patches.items()))
+    if replace:
+        new_params = patch_table.c.patch
+    else:
+        new_params = func.coalesce(UserDevices.params, func.jsonb_build_object()).op("||")(patch_table.c.patch)
+    return (
+        update(UserDevices)
+        .where(UserDevices.id == patch_table.c.id)
+        .values(params=new_params)
+        .returning(UserDevices.id, UserDevices.params)
+    )
+
+
+class DeviceStateStore:
+    """
+    Отложенная запись состояния устройств (DEVICE_WRITE_MODE=write_behind).
+
+    Изменения применяются к состоянию в памяти сразу, последовательные изменения
+    одного устройства объединяются, а в Postgres уходят пачкой раз в DEVICE_FLUSH_INTERVAL
+    секунд (или при накоплении DEVICE_FLUSH_MAX_BATCH устройств) и при остановке бота.
+
+    Сохранность до записи в БД задаёт DEVICE_WRITE_DURABILITY:
+    none - изменения за последний интервал теряются при падении процесса;
+    journal - каждое изменение дописывается в журнал на диске (переживает падение процесса);
+    fsync - то же с fsync каждой записи (переживает и отключение питания).
+    Журнал, оставшийся после падения, применяется к БД при запуске (recover).
+    """
+
+    def __init__(self, mode, interval, max_batch, durability, journal_dir):
+        self.enabled = mode == "write_behind"
+        self.interval = interval
+        self.max_batch = max_batch
+        self.durability = durability
+        self.journal_dir = journal_dir
+        # device_id -> актуальные params (пока изменения не записаны в БД)
+        self._params = {}
+        # device_id -> (заменить params целиком, накопленные изменения)
+        self._pending = {}
+        self._journal = None
+        self._segment = 0
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+
+    # Состояние в памяти
+
+    def get(self, device_id):
+        params = self._params.get(device_id)
+        return dict(params) if params is not None else None
+
+    def remember(self, device_id, params):
+        """
+        Запоминает params, прочитанные из кэша или БД, если более свежих в памяти нет.
+        """
+        self._params.setdefault(device_id, dict(params or {}))
+
+    def apply(self, device_id, patch, replace=False):
+        """
+        Применяет изменение к состоянию в памяти и ставит его в очередь на запись.
+        Возвращает новые params устройства.
+        """
+        if replace:
+            params = dict(patch)
+        else:
+            params = {**self._params.get(device_id, {}), **patch}
+        self._params[device_id] = params
+
+        entry = self._pending.get(device_id)
+        if entry is None:
+            self._pending[device_id] = (replace, dict(patch))
+        else:
+            metrics.inc("device_state_coalesced")
+            self._pending[device_id] = (True, params) if replace or entry[0] else (False, {**entry[1], **patch})
+
+        self._write_journal({"id": device_id, "patch": patch, "replace": replace})
+        metrics.set("device_state_pending", len(self._pending))
+        if len(self._pending) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+        return dict(params)
+
+    def forget(self, device_id):
+        """
+        Устройство удалено: его несохранённые изменения больше не нужны.
+        """
+        self._params.pop(device_id, None)
+        self._pending.pop(device_id, None)
+
+    def overlay(self, devices):
+        """
+        Подставляет в прочитанные записи устройств params из памяти, ещё не записанные в БД.
+        """
+        if not self._params:
+            return devices
+        for device in devices:
+            params = self._params.get(device.id)
+            if params is not None:
+                device.params = dict(params)
+        return devices
+
+    # Журнал
+
+    def _segment_path(self, segment):
+        return os.path.join(self.journal_dir, f"{JOURNAL_PREFIX}{segment:012d}")
+
+    def _segments(self):
+        if not os.path.isdir(self.journal_dir):
+            return []
+        return sorted(
+            int(name[len(JOURNAL_PREFIX):])
+            for name in os.listdir(self.journal_dir)
+            if name.startswith(JOURNAL_PREFIX)
+        )
+
+    def _open_segment(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._segment = max(self._segments(), default=self._segment) + 1
+        self._journal = open(self._segment_path(self._segment), "a", encoding="utf-8")
+
+    def _write_journal(self, record):
+        if self.durability == "none":
+            return
+        if self._journal is None:
+            self._open_segment()
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        if self.durability == "fsync":
+            os.fsync(self._journal.fileno())
+
+    def _rotate_journal(self):
+        """
+        Закрывает текущий сегмент журнала: всё, что в нём, уходит в начинающуюся запись в БД.
+        Возвращает номер закрытого сегмента.
+        """
+        if self._journal is None:
+            return self._segment
+        self._journal.close()
+        self._journal = None
+        return self._segment
+
+    def _drop_segments(self, up_to):
+        for segment in self._segments():
+            if segment <= up_to:
+                os.remove(self._segment_path(segment))
+
+    # Запись в БД
+
+    async def _write(self, pending):
+        merge = {device_id: patch for device_id, (replace, patch) in pending.items() if not replace}
+        replace = {device_id: patch for device_id, (replace, patch) in pending.items() if replace}
+        updated = {}
+        token = current_method.set("DeviceStateStore.flush")
+        try:
+            async with async_session_maker() as session:
+                # У каждого устройства в пачке либо замена params, либо слияние
+                for patches, is_replace in ((replace, True), (merge, False)):
+                    if patches:
+                        result = await session.execute(patch_query(patches, replace=is_replace))
+                        updated.update(result.all())
+                await session.commit()
+        finally:
+            current_method.reset(token)
+        return updated
+
+    async def flush(self):
+        """
+        Записывает накопленные изменения в БД одной транзакцией.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            segment = self._rotate_journal()
+            started = time.perf_counter()
+            try:
+                updated = await self._write(pending)
+            except Exception as e:
+                # Возвращаем изменения в очередь под более новые; сегменты журнала остаются на диске
+                for device_id, (replace, patch) in pending.items():
+                    newer = self._pending.get(device_id)
+                    if newer is None:
+                        self._pending[device_id] = (replace, patch)
+                    elif not newer[0]:
+                        self._pending[device_id] = (replace, {**patch, **newer[1]})
+                metrics.inc("device_state_flush_errors")
+                logger.error(f"Не удалось записать состояние {len(pending)} устройств: {e}")
+                raise
+
+            self._drop_segments(segment)
+            for device_id, params in updated.items():
+                if device_id in self._pending:
+                    # Пока шла запись, пришли новые изменения: в кэше остаются значения из памяти
+                    device_cache.patch_device(device_id, self._params[device_id])
+                else:
+                    self._params.pop(device_id, None)
+                    device_cache.patch_device(device_id, params)
+            for device_id in pending.keys() - updated.keys():
+                # Устройство удалено до записи
+                if device_id not in self._pending:
+                    self._params.pop(device_id, None)
+
+            metrics.inc("device_state_flushes")
+            metrics.inc("device_state_flushed_rows", len(pending))
+            metrics.observe("device_state_flush_seconds", time.perf_counter() - started)
+            metrics.set("device_state_pending", len(self._pending))
+            return len(pending)
+
+    async def recover(self):
+        """
+        Применяет к БД журнал, оставшийся после аварийной остановки. Вызывается при запуске.
+        """
+        segments = self._segments()
+        if not segments:
+            return 0
+
+        pending = {}
+        for segment in segments:
+            with open(self._segment_path(segment), encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Недописанная последняя строка при падении во время записи
+                        logger.warning(f"Пропущена повреждённая запись журнала {segment}")
+                        continue
+                    device_id, patch, replace = record["id"], record["patch"], record["replace"]
+                    entry = pending.get(device_id)
+                    if entry is None or replace:
+                        pending[device_id] = (replace, dict(patch))
+                    else:
+                        pending[device_id] = (entry[0], {**entry[1], **patch})
+
+        if pending:
+            await self._write(pending)
+        self._drop_segments(segments[-1])
+        self._segment = segments[-1]
+        metrics.inc("device_state_recovered", len(pending))
+        logger.warning(f"Восстановлено из журнала состояние {len(pending)} устройств")
+        return len(pending)
+
+    # Фоновая запись
+
+    def start(self):
+        if not self.enabled:
+            return None
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Ошибка уже залогирована, изменения вернулись в очередь - повторим на следующем интервале
+                pass
+
+    async def close(self):
+        """
+        Останавливает фоновую запись и записывает оставшиеся изменения.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+state_store = DeviceStateStore(
+    mode=settings.DEVICE_WRITE_MODE,
+    interval=settings.DEVICE_FLUSH_INTERVAL,
+    max_batch=settings.DEVICE_FLUSH_MAX_BATCH,
+    durability=settings.DEVICE_WRITE_DURABILITY,
+    journal_dir=settings.DEVICE_WRITE_JOURNAL_DIR,
+)
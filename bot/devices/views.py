@@ -0,0 +1,149 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from bot.config import settings
+from bot.db.base import has_pending_writes
+from bot.devices.cache import device_cache
+from bot.devices.keyboards import device_info_keyboard, my_devices_keyboard
+from bot.devices.service import DeviceService
+from bot.metrics import metrics
+
+
+logger = logging.getLogger("smart_home_bot")
+
+MY_DEVICES_TEXT = "📱 Ваши устройства:"
+NO_DEVICES_TEXT = "❌ У вас нет добавленных устройств"
+PARAMS_PROMPT = "Введите параметр и установочное значение в формате\nParam: Value\n\nДля отмены просто введите 0"
+
+
+class ViewCache:
+    """
+    Готовые экраны устройств (текст и клавиатура) по версии снимка устройств пользователя
+    (DeviceSnapshotCache) с вытеснением по LRU. Версия меняется при любом изменении устройств,
+    поэтому устаревший экран по ней уже не найдётся.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # (вид, версия, ...) -> (текст, клавиатура)
+        self._views = OrderedDict()
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            view = self._views.get(key)
+            if view is not None:
+                self._views.move_to_end(key)
+        metrics.inc("device_view_cache", result="hit" if view is not None else "miss")
+        return view
+
+    def put(self, key, view):
+        if key is None:
+            return
+        with self._lock:
+            self._views[key] = view
+            while len(self._views) > self.maxsize:
+                self._views.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_cache = ViewCache(settings.DEVICE_VIEW_CACHE_SIZE)
+
+
+def _key(kind, version, *args):
+    # Нет снимка в кэше или в unit of work есть незафиксированные изменения: версия их не отражает
+    if version is None or has_pending_writes():
+        return None
+    return (kind, version, *args)
+
+
+def condition_text(params):
+    return "✅ Включено" if (params or {}).get("condition") == "ON" else "❌ Выключено"
+
+
+def device_view(device):
+    """
+    Карточка устройства: (текст, клавиатура).
+    """
+    params = device.params or {}
+    lines = [f"📱 Устройство: {device.name}", "", f"Состояние: {condition_text(params)}", "Параметры:"]
+    lines += [f"{key}: {value}" for key, value in params.items()]
+    return "\n".join(lines), device_info_keyboard(device)
+
+
+async def device_list_view(tg_id):
+    """
+    Экран "Мои устройства": (текст, клавиатура или None, если устройств нет).
+    """
+    # Версия берётся до чтения устройств: экран под ней не старее снимка этой версии
+    key = _key("list", device_cache.version_by_tg(tg_id))
+    view = view_cache.get(key)
+    if view is None:
+        devices = await DeviceService.get_user_devices(tg_id)
+        view = (MY_DEVICES_TEXT, my_devices_keyboard(devices)) if devices else (NO_DEVICES_TEXT, None)
+        view_cache.put(key, view)
+    return view
+
+
+async def device_info_view(device_id):
+    """
+    Карточка устройства по id или None, если устройство не найдено.
+    """
+    key = _key("info", device_cache.version_by_device(device_id), device_id)
+    view = view_cache.get(key)
+    if view is None:
+        device = await DeviceService.get_my_device_by_id(device_id)
+        if device is None:
+            return None
+        view = device_view(device)
+        view_cache.put(key, view)
+    return view
+
+
+def _dump(reply_markup):
+    # Сравниваем по содержимому: у объектов из обновления есть ещё ссылка на бота
+    return reply_markup.model_dump(exclude_none=True) if reply_markup is not None else None
+
+
+def _unchanged(message, text, reply_markup):
+    # Telegram не хранит пробелы в конце текста
+    return message.text == text.rstrip() and _dump(message.reply_markup) == _dump(reply_markup)
+
+
+async def show(callback, view, notice=None):
+    """
+    Показывает экран на месте сообщения с нажатой кнопкой: одно редактирование вместо
+    новых сообщений и удаления старого; если экран не изменился, сообщение не трогается.
+    notice - всплывающее уведомление в ответе на нажатие вместо отдельного сообщения.
+    """
+    text, reply_markup = view
+    message = callback.message
+    if not isinstance(message, Message):
+        # Сообщение недоступно (слишком старое) - отправляем экран заново
+        await callback.bot.send_message(callback.from_user.id, text, reply_markup=reply_markup)
+        metrics.inc("device_view_renders", result="sent")
+    elif _unchanged(message, text, reply_markup):
+        metrics.inc("device_view_renders", result="skipped")
+    else:
+        try:
+            await message.edit_text(text, reply_markup=reply_markup)
+            metrics.inc("device_view_renders", result="edited")
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                # Повторное нажатие: экран уже показан обработкой предыдущего
+                metrics.inc("device_view_renders", result="skipped")
+            else:
+                logger.warning(f"Не удалось изменить сообщение {message.message_id}: {e}")
+                await message.answer(text, reply_markup=reply_markup)
+                metrics.inc("device_view_renders", result="sent")
+    # Ответ на нажатие обязателен: без него кнопка остаётся в состоянии загрузки
+    await callback.answer(notice)
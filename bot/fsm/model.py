@@ -0,0 +1,14 @@
+from sqlalchemy import Column, DateTime, String, text
+from sqlalchemy.dialects.postgresql import JSONB
+from bot.db.base import Base
+
+
+class FSMRecord(Base):
+    __tablename__ = "fsm_states"
+
+    # Ключ aiogram: fsm:<bot_id>:<chat_id>:<user_id>:<destiny>
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    # Брошенные диалоги перестают читаться после expires_at и удаляются фоновой очисткой
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from sqlalchemy import and_, case, delete, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import JSONB, insert
+
+from bot.config import settings
+from bot.db.base import async_session_maker, commit, current_session, on_commit, use_session
+from bot.db.instrumentation import current_method
+from bot.db.listener import CACHE_CHANNEL, pg_listener
+from bot.fsm.model import FSMRecord
+from bot.metrics import metrics
+
+
+logger = logging.getLogger("smart_home_bot")
+
+EMPTY_DATA = literal({}, JSONB)
+# Поле не передано в _upsert (None - допустимое значение state)
+_UNSET = object()
+
+
+class PostgresStorage(BaseStorage):
+    """
+    Хранилище FSM aiogram в таблице fsm_states: состояние диалога переживает перезапуск
+    и доступно всем процессам бота.
+
+    Каждая запись - один INSERT ... ON CONFLICT DO UPDATE. Запись продлевает срок жизни
+    на ttl секунд; просроченная запись читается как пустая и удаляется фоновой очисткой.
+    Прочитанное кэшируется в процессе (LRU, cache_ttl секунд) и сбрасывается по уведомлениям
+    об изменениях из других процессов. В unit of work запись идёт в транзакции обновления:
+    при откате хэндлера состояние тоже откатывается.
+    """
+
+    def __init__(self, ttl, cache_size, cache_ttl, cleanup_interval):
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cleanup_interval = cleanup_interval
+        self._lock = threading.Lock()
+        # key -> (истекает, state, data); отсутствие записи тоже кэшируется как (None, {})
+        self._cache = OrderedDict()
+        # Счётчик записей: прочитанное до записи не кэшируется
+        self._writes = 0
+        self._cleanup_task = None
+
+    # Кэш
+
+    def _cached(self, key):
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None or item[0] < time.monotonic():
+                metrics.inc("fsm_cache", result="miss")
+                return None
+            self._cache.move_to_end(key)
+        metrics.inc("fsm_cache", result="hit")
+        return item[1], item[2]
+
+    def _put(self, key, state, data, token=None):
+        with self._lock:
+            if token is not None and token != self._writes:
+                return
+            self._cache[key] = (time.monotonic() + self.cache_ttl, state, data)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._writes += 1
+            self._cache.pop(key, None)
+
+    def clear_cache(self):
+        with self._lock:
+            self._writes += 1
+            self._cache.clear()
+
+    def on_notify(self, payload):
+        """
+        Изменение из другого процесса бота: "fsm_states:<key>".
+        """
+        table, _, key = payload.partition(":")
+        if table == "fsm_states":
+            self.invalidate(key)
+
+    # Чтение и запись
+
+    @staticmethod
+    def _pending(session):
+        # Записи текущего unit of work, ещё не зафиксированные commit
+        return session.info.setdefault("fsm", {}) if session is not None and session.info.get("unit_of_work") else None
+
+    async def _load(self, key):
+        pending = self._pending(current_session.get())
+        if pending is not None and key in pending:
+            return pending[key]
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        token = self._writes
+        async with use_session() as session:
+            result = await session.execute(
+                select(FSMRecord.state, FSMRecord.data)
+                .where(FSMRecord.key == key, FSMRecord.expires_at > func.now())
+            )
+            row = result.first()
+        state, data = (row.state, row.data) if row is not None else (None, {})
+        self._put(key, state, data, token)
+        return state, data
+
+    async def _upsert(self, key, state=_UNSET, data=_UNSET, merge=False):
+        """
+        Записывает state и/или data. merge=True сливает data с сохранёнными (update_data).
+        Поля просроченной записи, которые не переданы, сбрасываются.
+        Возвращает (state, data) после записи.
+        """
+        expired = FSMRecord.expires_at <= func.now()
+        excluded = insert(FSMRecord).excluded
+        values = {"key": key, "expires_at": func.now() + timedelta(seconds=self.ttl)}
+        update = {"expires_at": excluded.expires_at}
+        if state is not _UNSET:
+            values["state"] = state
+            update["state"] = excluded.state
+        else:
+            update["state"] = case((expired, None), else_=FSMRecord.state)
+        if data is not _UNSET:
+            values["data"] = data
+            update["data"] = (
+                case((expired, excluded.data), else_=FSMRecord.data.op("||")(excluded.data)) if merge
+                else excluded.data
+            )
+        else:
+            update["data"] = case((expired, EMPTY_DATA), else_=FSMRecord.data)
+
+        query = (
+            insert(FSMRecord)
+            .values(**values)
+            .on_conflict_do_update(index_elements=[FSMRecord.key], set_=update)
+            .returning(FSMRecord.state, FSMRecord.data)
+        )
+        token = current_method.set("PostgresStorage.write")
+        try:
+            async with use_session() as session:
+                row = (await session.execute(query)).one()
+                await commit(session)
+                result = (row.state, row.data)
+                pending = self._pending(session)
+                if pending is not None:
+                    pending[key] = result
+                    on_commit(session, self._put, key, *result)
+                else:
+                    self._put(key, *result)
+        finally:
+            current_method.reset(token)
+        with self._lock:
+            self._writes += 1
+        metrics.inc("fsm_writes")
+        return result
+
+    async def set_state(self, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        await self._upsert(self.key_builder.build(key), state=state)
+
+    async def get_state(self, key):
+        return (await self._load(self.key_builder.build(key)))[0]
+
+    async def set_data(self, key, data):
+        await self._upsert(self.key_builder.build(key), data=dict(data))
+
+    async def get_data(self, key):
+        return dict((await self._load(self.key_builder.build(key)))[1])
+
+    async def update_data(self, key, data):
+        # Слияние на стороне БД: один запрос вместо чтения и записи
+        _, result = await self._upsert(self.key_builder.build(key), data=dict(data), merge=True)
+        return dict(result)
+
+    # Очистка
+
+    async def cleanup(self, batch=1000):
+        """
+        Удаляет просроченные и пустые записи пачками. Возвращает число удалённых.
+        """
+        removed = 0
+        token = current_method.set("PostgresStorage.cleanup")
+        try:
+            while True:
+                stale = (
+                    select(FSMRecord.key)
+                    .where(or_(
+                        FSMRecord.expires_at <= func.now(),
+                        and_(FSMRecord.state.is_(None), FSMRecord.data == EMPTY_DATA),
+                    ))
+                    .limit(batch)
+                    .with_for_update(skip_locked=True)
+                )
+                async with async_session_maker() as session:
+                    result = await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(stale)))
+                    await session.commit()
+                removed += result.rowcount
+                if result.rowcount < batch:
+                    break
+        finally:
+            current_method.reset(token)
+        metrics.inc("fsm_cleaned", removed)
+        return removed
+
+    def start(self):
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.get_running_loop().create_task(self._run_cleanup())
+        return self._cleanup_task
+
+    async def _run_cleanup(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                removed = await self.cleanup()
+                if removed:
+                    logger.info(f"Удалено устаревших состояний FSM: {removed}")
+            except Exception as e:
+                logger.warning(f"Не удалось очистить состояния FSM: {e}")
+
+    async def close(self):
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
+
+
+fsm_storage = PostgresStorage(
+    ttl=settings.FSM_TTL,
+    cache_size=settings.FSM_CACHE_SIZE,
+    cache_ttl=settings.FSM_CACHE_TTL,
+    cleanup_interval=settings.FSM_CLEANUP_INTERVAL,
+)
+# Пока подписки не было, изменения других процессов могли быть пропущены
+pg_listener.subscribe(CACHE_CHANNEL, fsm_storage.on_notify, on_connect=fsm_storage.clear_cache)
@@ -4,7 +4,7 @@ from aiogram.filters import Command
 
 from bot.devices.service import DeviceService
 from bot.general.keyboards import main_menu
-from bot.AI.llm import process_user_input
+from bot.AI.commands import command_tracker
 router = Router()
 
 
@@ -19,6 +19,6 @@ async def go_back(message: Message):
 
 @router.message()
 async def default_handler(message: Message):
-    answer = await process_user_input(message.text, message.from_user.id)
-    await message.answer(answer)
+    # Ответ придёт после разбора; следующее сообщение пользователя до ответа объединится с этим
+    command_tracker.submit(message.from_user.id, message.text, message.answer)
 
@@ -6,8 +6,7 @@ from pydub import AudioSegment
 
 from gtts import gTTS #text-to-speech
 
-from bot.AI.llm import process_user_input
-from bot.users.service import UserService
+from bot.AI.commands import command_tracker
 
 router = Router()
 
@@ -19,7 +18,7 @@ os.makedirs(AUDIO_DIR, exist_ok=True)
 
 
 @router.message(lambda message: message.voice)
-async def handle_voice_message(message: Message):
+async def handle_voice_message(message: Message, user=None):
     voice = message.voice
     file_info = await message.bot.get_file(voice.file_id)
     file_path = file_info.file_path
@@ -41,22 +40,24 @@ async def handle_voice_message(message: Message):
         try:
             text = recognizer.recognize_google(audio_data, language="ru-RU")
 
-            answer = await process_user_input(text, message.from_user.id)
+            async def reply(answer):
+                if user.voice_on:
+                    tts = gTTS(answer, lang="ru")
 
-            user = await UserService.get_user_by_tg_id(message.from_user.id)
-            if user.voice_on:
-                tts = gTTS(answer, lang="ru")
+                    audio_path = os.path.join(AUDIO_DIR, f"{message.message_id}.ogg")
+                    tts.save(audio_path)
 
-                audio_path = os.path.join(AUDIO_DIR, f"{message.message_id}.ogg")
-                tts.save(audio_path)
+                    await message.answer_voice(FSInputFile(audio_path))
 
-                await message.answer_voice(FSInputFile(audio_path))
+                    os.remove(audio_path)
+                else:
+                    await message.answer(answer)
 
-                os.remove(audio_path)
-            else:
-                await message.answer(answer)
+                await wait_message.delete()
 
-            await wait_message.delete()
+            # Ответ придёт после разбора; если пользователь успеет отправить ещё команду,
+            # они объединятся и "Обрабатываю" этого сообщения удалится
+            command_tracker.submit(message.from_user.id, text, reply, discard=wait_message.delete)
         except sr.UnknownValueError:
             await message.answer("Не удалось распознать речь.")
         except sr.RequestError:
@@ -1,8 +1,19 @@
 import asyncio
 import logging
+import multiprocessing
+import os
+import secrets
+import signal
+import time
+from multiprocessing.connection import wait
 
+STARTED_AT = time.monotonic()
+
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from bot.config import settings
 
@@ -11,7 +22,17 @@ from bot.devices.handler import router as devices_router
 from bot.general.handler import router as general_router
 from bot.general.voice import router as voice_router
 
-from bot.middleware import RegistrationMiddleware
+from bot.middleware import (
+    ApiCallCounter, ApiCallsMiddleware, ChatQueueMiddleware, PoolCheckoutMiddleware, RegistrationMiddleware,
+    UnitOfWorkMiddleware,
+)
+from bot.AI.commands import command_tracker
+from bot.AI.llm import schedule_catalog_index
+from bot.AI.models import start_warmup
+from bot.db.base import engine
+from bot.db.listener import pg_listener
+from bot.devices.state_store import state_store
+from bot.fsm.storage import fsm_storage
 
 
 logging.basicConfig(
@@ -21,12 +42,70 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-bot = Bot(token=settings.BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL)) if settings.TELEGRAM_API_URL else None
+bot = Bot(token=settings.BOT_TOKEN, session=session)
+bot.session.middleware(ApiCallCounter())
+# Состояния диалогов в Postgres: переживают перезапуск и общие для всех воркеров
+dp = Dispatcher(storage=fsm_storage)
 
 
+# Первым: остальные middleware и хэндлеры выполняются уже в очереди чата
+chat_queue = ChatQueueMiddleware(
+    max_concurrency=settings.UPDATE_CONCURRENCY,
+    max_queued=settings.UPDATE_QUEUE_MAX,
+    chat_queue_max=settings.UPDATE_CHAT_QUEUE_MAX,
+    shards=settings.UPDATE_SHARDS,
+)
+dp.update.outer_middleware.register(chat_queue)
+# Разбор команд к AI продолжается после хэндлера, но в тех же лимитах очереди
+command_tracker.use_queue(chat_queue)
+dp.update.outer_middleware.register(PoolCheckoutMiddleware())
+dp.update.outer_middleware.register(ApiCallsMiddleware())
 dp.message.middleware.register(RegistrationMiddleware())
 
+# Меню аккаунта и устройств работают с БД одной транзакцией на обновление.
+# AI-запросы (общий и голосовой роутеры) остаются на коротких сессиях,
+# чтобы не держать соединение из пула на время ответа LLM.
+for router in (users_router, devices_router):
+    router.message.middleware.register(UnitOfWorkMiddleware())
+    router.callback_query.middleware.register(UnitOfWorkMiddleware())
+
+
+_first_response_logged = False
+
+
+@dp.update.outer_middleware()
+async def first_response_timer(handler, event, data):
+    global _first_response_logged
+    result = await handler(event, data)
+    if not _first_response_logged:
+        _first_response_logged = True
+        logger.info(f"Первый ответ через {time.monotonic() - STARTED_AT:.1f} с после запуска")
+    return result
+
+
+@dp.startup()
+async def on_startup():
+    # Модели грузятся в фоне: меню и регистрация отвечают сразу, AI-запросы ждут готовности
+    start_warmup()
+    # Подписка на изменения каталога устройств и кэшей из других процессов, векторы каталога после загрузки моделей
+    pg_listener.start()
+    schedule_catalog_index()
+    # Изменения устройств, не записанные в БД до аварийной остановки, и фоновая запись (write_behind)
+    await state_store.recover()
+    state_store.start()
+    # Удаление брошенных диалогов
+    fsm_storage.start()
+    logger.info(f"Бот готов принимать обновления через {time.monotonic() - STARTED_AT:.1f} с после запуска")
+
+
+@dp.shutdown()
+async def on_shutdown():
+    # Сначала дорабатывают принятые обновления, затем записываются их изменения
+    await chat_queue.close()
+    await command_tracker.close()
+    await state_store.close()
+
 # Routers
 dp.include_router(users_router)
 dp.include_router(devices_router)
@@ -34,9 +113,116 @@ dp.include_router(voice_router)
 dp.include_router(general_router)
 
 
+def run_polling():
+    async def start():
+        # Вебхук, оставшийся от запуска в режиме webhook, не даёт получать обновления через getUpdates
+        await bot.delete_webhook()
+        # Обновления ставятся в очереди чатов без ожидания обработки; пока очереди заполнены,
+        # новые обновления не запрашиваются
+        await dp.start_polling(bot, handle_as_tasks=False)
+
+    asyncio.run(start())
+
+
+def create_webhook_app():
+    app = web.Application()
+    # Telegram получает 200, как только обновление принято в очередь чата (ChatQueueMiddleware);
+    # пока очереди заполнены, ответ задерживается и Telegram не присылает лишнего.
+    # Запросы без верного X-Telegram-Bot-Api-Secret-Token получают 401.
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=False,
+        secret_token=settings.WEBHOOK_SECRET,
+    ).register(app, path=settings.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def run_webhook_worker(worker=None):
+    if worker is not None:
+        logger.info(f"Воркер вебхука {worker} запущен (pid {os.getpid()})")
+    web.run_app(
+        create_webhook_app(),
+        host=settings.WEBHOOK_HOST,
+        port=settings.WEBHOOK_PORT,
+        # Все воркеры слушают один порт, ядро распределяет между ними входящие соединения
+        reuse_port=worker is not None,
+        print=None,
+    )
+
+
+async def prepare_webhook():
+    """
+    Выполняется один раз до запуска воркеров: журнал отложенной записи и регистрация вебхука.
+    """
+    await state_store.recover()
+    await bot.set_webhook(
+        url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+        secret_token=settings.WEBHOOK_SECRET,
+        max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    await bot.session.close()
+    await engine.dispose()
+
+
+def run_webhook():
+    if not settings.WEBHOOK_URL:
+        raise RuntimeError("Для BOT_MODE=webhook нужно задать WEBHOOK_URL")
+    if state_store.enabled and settings.WEBHOOK_WORKERS > 1:
+        # Состояние отложенной записи живёт в памяти одного процесса: воркеры затирали бы изменения друг друга
+        raise RuntimeError("DEVICE_WRITE_MODE=write_behind работает только с WEBHOOK_WORKERS=1")
+    if not settings.WEBHOOK_SECRET:
+        # Воркеры читают настройки из окружения при запуске
+        settings.WEBHOOK_SECRET = os.environ["WEBHOOK_SECRET"] = secrets.token_urlsafe(32)
+
+    asyncio.run(prepare_webhook())
+    if settings.WEBHOOK_WORKERS <= 1:
+        run_webhook_worker()
+        return
+
+    context = multiprocessing.get_context("spawn")
+    workers = {}
+    stopping = False
+
+    def start_worker(index):
+        process = context.Process(target=run_webhook_worker, args=(index,), name=f"webhook-{index}")
+        process.start()
+        workers[index] = process
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in workers.values():
+            process.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(settings.WEBHOOK_WORKERS):
+        start_worker(index)
+    logger.info(f"Вебхук: {settings.WEBHOOK_WORKERS} воркеров на порту {settings.WEBHOOK_PORT}")
+
+    # Упавший воркер перезапускается, пока не пришёл сигнал остановки
+    while workers:
+        finished = wait([process.sentinel for process in workers.values()])
+        for index, process in list(workers.items()):
+            if process.sentinel not in finished:
+                continue
+            process.join()
+            del workers[index]
+            if not stopping:
+                logger.error(f"Воркер вебхука {index} завершился с кодом {process.exitcode}, перезапуск")
+                time.sleep(1)
+                start_worker(index)
+
+
 if __name__ == "__main__":
     logger.info("Бот Запущен")
     try:
-        dp.run_polling(bot)
+        if settings.BOT_MODE == "webhook":
+            run_webhook()
+        else:
+            run_polling()
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
@@ -1,23 +1,39 @@
+import asyncio
 import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 
 from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
 from aiogram.types import Message, ReplyKeyboardRemove
+
+from bot.db.base import async_session_maker, current_session, pool_checkouts
+from bot.metrics import metrics
 from bot.users.service import UserService
 
 
 logger = logging.getLogger(__name__)
 
+# Счётчик запросов к Bot API текущего обновления (см. ApiCallsMiddleware)
+api_calls = ContextVar("api_calls", default=None)
+
 
 class RegistrationMiddleware(BaseMiddleware):
     async def __call__(self, handler, event, data):
         try:
             if isinstance(event, Message):
                 user_id = event.from_user.id
+                # Пользователь определяется один раз за обновление и передаётся хэндлерам аргументом user
+                user = await UserService.get_user_by_tg_id(user_id)
+                data["user"] = user
+
                 state = data.get("state")
                 if state is not None and await state.get_state() is not None:
                     return await handler(event, data)
 
-                if (await UserService.get_user_by_tg_id(user_id) is None) and event.text != "/start":
+                if user is None and event.text != "/start":
                     await event.answer(
                         "Вы не зарегистрированы. Пожалуйста, начните регистрацию, вызвав команду /start.",
                         reply_markup=ReplyKeyboardRemove(),
@@ -35,4 +51,224 @@ class RegistrationMiddleware(BaseMiddleware):
             )
             if isinstance(event, Message):
                 await event.answer("Произошла ошибка. Попробуйте позже.")
-            return None
\ No newline at end of file
+            return None
+
+
+class UnitOfWorkMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД на обновление: сервисы берут её из контекста, вместо commit делают flush,
+    а commit (или откат при ошибке) выполняется один раз после хэндлера.
+    Действия после фиксации (сброс кэшей) выполняются только после успешного commit.
+    """
+
+    async def __call__(self, handler, event, data):
+        async with async_session_maker(info={"unit_of_work": True, "on_commit": []}) as session:
+            token = current_session.set(session)
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+            finally:
+                current_session.reset(token)
+
+        for callback, args in session.info["on_commit"]:
+            callback(*args)
+        return result
+
+
+class PoolCheckoutMiddleware(BaseMiddleware):
+    """
+    Считает, сколько раз за обновление соединение выдавалось из пула БД (метрика db_pool_checkouts_per_update).
+    """
+
+    async def __call__(self, handler, event, data):
+        counter = [0]
+        token = pool_checkouts.set(counter)
+        try:
+            return await handler(event, data)
+        finally:
+            pool_checkouts.reset(token)
+            metrics.observe("db_pool_checkouts_per_update", counter[0])
+
+
+class ApiCallsMiddleware(BaseMiddleware):
+    """
+    Считает запросы к Bot API за обработку обновления (метрика bot_api_calls_per_update).
+    Ответы AI, отправленные после обработки (bot/AI/commands.py), сюда не входят.
+    """
+
+    async def __call__(self, handler, event, data):
+        counter = [0]
+        token = api_calls.set(counter)
+        try:
+            return await handler(event, data)
+        finally:
+            api_calls.reset(token)
+            metrics.observe("bot_api_calls_per_update", counter[0])
+
+
+class ApiCallCounter(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: каждый запрос к Bot API (метрика bot_api_calls по методам).
+    """
+
+    async def __call__(self, make_request, bot, method):
+        counter = api_calls.get()
+        if counter is not None:
+            counter[0] += 1
+        metrics.inc("bot_api_calls", method=method.__api_method__)
+        return await make_request(bot, method)
+
+
+class ChatQueueMiddleware(BaseMiddleware):
+    """
+    Слой выполнения обновлений: обновления одного чата обрабатываются строго по очереди,
+    разных чатов - параллельно, но не больше max_concurrency хэндлеров одновременно.
+
+    Внешний middleware на dp.update, зарегистрированный первым: ставит обновление в очередь
+    чата и сразу возвращает управление, обработка идёт в задаче чата. Всего в очередях
+    не больше max_queued обновлений: когда они заполнены, приём ждёт (polling не запрашивает
+    новые обновления, вебхук не отвечает Telegram). Чат, у которого в очереди уже
+    chat_queue_max обновлений, считается флудом: новые его обновления отбрасываются,
+    а пользователь один раз получает предупреждение.
+    Работа, которая продолжается после возврата хэндлера (команды к AI), занимает место
+    в тех же лимитах через hold().
+    Метрики по шардам (chat_id % shards): глубина очереди и ожидание начала обработки.
+    """
+
+    FLOOD_MESSAGE = "⏳ Слишком много сообщений подряд. Дождитесь ответа на предыдущие."
+
+    def __init__(self, max_concurrency, max_queued, chat_queue_max, shards):
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.chat_queue_max = chat_queue_max
+        self.shards = shards
+        # chat_id -> deque[(handler, event, data, время приёма)], первая запись обрабатывается
+        self._chats = {}
+        self._shard_depth = [0] * shards
+        self._queued = 0
+        # Чаты, уже предупреждённые о флуде (до опустошения их очереди)
+        self._warned = set()
+        self._tasks = set()
+        # chat_id -> работы чата вне хэндлеров (hold), которых ждут его обновления
+        self._holds = {}
+        self._slots = None
+        self._admission = None
+
+    def _limits(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._admission = asyncio.Semaphore(self.max_queued)
+
+    async def __call__(self, handler, event, data):
+        chat = data.get("event_chat")
+        sender = data.get("event_from_user")
+        chat_id = chat.id if chat is not None else sender.id if sender is not None else None
+        if chat_id is None:
+            return await handler(event, data)
+
+        self._limits()
+        if self._flooding(chat_id, data):
+            return None
+        started = time.perf_counter()
+        await self._admission.acquire()
+        metrics.observe("update_admission_wait_seconds", time.perf_counter() - started)
+        # Пока ждали места, очередь чата могла заполниться
+        if self._flooding(chat_id, data):
+            self._admission.release()
+            return None
+
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = deque()
+            task = asyncio.create_task(self._drain(chat_id, queue))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        queue.append((handler, event, data, time.perf_counter()))
+        self._track(chat_id, 1)
+        return None
+
+    def _flooding(self, chat_id, data):
+        queue = self._chats.get(chat_id)
+        if queue is None or len(queue) < self.chat_queue_max:
+            return False
+        metrics.inc("updates_dropped", reason="chat_flood")
+        if chat_id not in self._warned:
+            self._warned.add(chat_id)
+            logger.warning(f"Флуд из чата {chat_id}: в очереди {len(queue)} обновлений, новые отбрасываются")
+            task = asyncio.create_task(self._warn(data["bot"], chat_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _warn(self, bot, chat_id):
+        try:
+            await bot.send_message(chat_id, self.FLOOD_MESSAGE)
+        except Exception as e:
+            logger.warning(f"Не удалось предупредить чат {chat_id} о флуде: {e}")
+
+    def _track(self, chat_id, delta):
+        shard = chat_id % self.shards
+        self._shard_depth[shard] += delta
+        self._queued += delta
+        metrics.set("update_queue_depth", self._shard_depth[shard], shard=shard)
+        metrics.set("updates_queued", self._queued)
+
+    async def _drain(self, chat_id, queue):
+        shard = chat_id % self.shards
+        try:
+            while queue:
+                handler, event, data, queued_at = queue[0]
+                # Сообщения пропускаются: их порядок с командами к AI держит CommandTracker
+                if getattr(event, "message", None) is None:
+                    await self._released(chat_id)
+                async with self._slots:
+                    metrics.observe("update_wait_seconds", time.perf_counter() - queued_at, shard=shard)
+                    try:
+                        await handler(event, data)
+                    except Exception:
+                        logger.exception(f"Ошибка обработки обновления из чата {chat_id}")
+                queue.popleft()
+                self._track(chat_id, -1)
+                self._admission.release()
+        finally:
+            del self._chats[chat_id]
+            self._warned.discard(chat_id)
+
+    @asynccontextmanager
+    async def hold(self, chat_id):
+        """
+        Место в очереди для работы чата, которая продолжается после возврата хэндлера
+        (команды к AI): занимает место приёма (max_queued) и слот обработки (max_concurrency),
+        а обновления чата, кроме сообщений, ждут её завершения.
+        """
+        self._limits()
+        await self._admission.acquire()
+        done = asyncio.get_running_loop().create_future()
+        self._holds.setdefault(chat_id, set()).add(done)
+        self._track(chat_id, 1)
+        try:
+            async with self._slots:
+                yield
+        finally:
+            holds = self._holds[chat_id]
+            holds.discard(done)
+            if not holds:
+                del self._holds[chat_id]
+            done.set_result(None)
+            self._track(chat_id, -1)
+            self._admission.release()
+
+    async def _released(self, chat_id):
+        while self._holds.get(chat_id):
+            await asyncio.wait(list(self._holds[chat_id]))
+
+    async def close(self, timeout=30):
+        """
+        Ждёт обработки уже принятых обновлений (при остановке бота).
+        """
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
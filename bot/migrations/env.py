@@ -11,6 +11,7 @@ from bot.db.base import Base
 # Tables
 from bot.users.model import User, UserSession
 from bot.devices.model import Device, UserDevices
+from bot.fsm.model import FSMRecord
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
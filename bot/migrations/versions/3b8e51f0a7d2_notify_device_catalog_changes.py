@@ -0,0 +1,42 @@
+"""Notify device catalog changes
+
+Revision ID: 3b8e51f0a7d2
+Revises: cbd4da60caea
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8e51f0a7d2'
+down_revision: Union[str, None] = 'cbd4da60caea'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Любое изменение каталога devices сообщает ботам в канал device_catalog (см. bot/devices/catalog.py)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_device_catalog() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('device_catalog', TG_OP);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER devices_notify_catalog
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON devices
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_device_catalog()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS devices_notify_catalog ON devices")
+    op.execute("DROP FUNCTION IF EXISTS notify_device_catalog()")
@@ -0,0 +1,61 @@
+"""Notify cache invalidation
+
+Revision ID: 7c2d94e1b6a0
+Revises: 3b8e51f0a7d2
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2d94e1b6a0'
+down_revision: Union[str, None] = '3b8e51f0a7d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = ("users", "user_sessions", "user_devices")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Изменения пользователей, сессий и устройств сообщают процессам бота в канал bot_cache,
+    # чтобы они сбросили свои кэши (см. bot/db/listener.py). NOTIFY доставляется только после commit.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS trigger AS $$
+        DECLARE
+            row RECORD;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                row := OLD;
+            ELSE
+                row := NEW;
+            END IF;
+            IF TG_TABLE_NAME = 'users' THEN
+                PERFORM pg_notify('bot_cache', 'users:' || row.id);
+            ELSIF TG_TABLE_NAME = 'user_sessions' THEN
+                PERFORM pg_notify('bot_cache', 'user_sessions:' || row.user_id || ':' || row.tg_id);
+            ELSE
+                PERFORM pg_notify('bot_cache', TG_TABLE_NAME || ':' || row.user_id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_notify_cache
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION notify_cache_invalidation()
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_cache ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS notify_cache_invalidation()")
@@ -0,0 +1,57 @@
+"""Add fsm_states
+
+Revision ID: a51e07c3d9f4
+Revises: 7c2d94e1b6a0
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a51e07c3d9f4'
+down_revision: Union[str, None] = '7c2d94e1b6a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('fsm_states',
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('state', sa.String(), nullable=True),
+    sa.Column('data', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'{}'::jsonb"), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_fsm_states_expires_at', 'fsm_states', ['expires_at'], unique=False)
+    # Изменения состояний сообщают процессам бота, чтобы они сбросили кэш FSM (см. bot/fsm/storage.py)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_fsm_state() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('bot_cache', 'fsm_states:' || OLD.key);
+            ELSE
+                PERFORM pg_notify('bot_cache', 'fsm_states:' || NEW.key);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER fsm_states_notify_cache
+        AFTER INSERT OR UPDATE OR DELETE ON fsm_states
+        FOR EACH ROW EXECUTE FUNCTION notify_fsm_state()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS fsm_states_notify_cache ON fsm_states")
+    op.execute("DROP FUNCTION IF EXISTS notify_fsm_state()")
+    op.drop_index('ix_fsm_states_expires_at', table_name='fsm_states')
+    op.drop_table('fsm_states')
@@ -0,0 +1,42 @@
+"""Add indexes for hot queries
+
+Revision ID: cbd4da60caea
+Revises: df7c786c19c3
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cbd4da60caea'
+down_revision: Union[str, None] = 'df7c786c19c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Уникальность имени устройства у пользователя: старые дубликаты переименовываем
+    op.execute("""
+        UPDATE user_devices d
+        SET name = d.name || ' (' || d.id || ')'
+        WHERE EXISTS (
+            SELECT 1 FROM user_devices o
+            WHERE o.user_id = d.user_id AND o.name = d.name AND o.id < d.id
+        )
+    """)
+    # Индекс (user_id, name) обслуживает и выборку устройств пользователя по user_id
+    op.create_unique_constraint('uq_user_devices_user_id_name', 'user_devices', ['user_id', 'name'])
+    op.create_index('ix_user_sessions_user_id', 'user_sessions', ['user_id'], unique=False)
+    op.create_index('ix_user_devices_device_id', 'user_devices', ['device_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_devices_device_id', table_name='user_devices')
+    op.drop_index('ix_user_sessions_user_id', table_name='user_sessions')
+    op.drop_constraint('uq_user_devices_user_id_name', 'user_devices', type_='unique')
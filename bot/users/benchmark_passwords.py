@@ -0,0 +1,83 @@
+"""
+Задержка цикла событий при одновременных входах пользователей.
+
+Запуск: python -m bot.users.benchmark_passwords [--logins N] [--rounds N]
+
+Запускает N одновременных проверок пароля и параллельно раз в 10 мс будит
+фоновую корутину, измеряя, насколько она опоздала (так же опаздывают команды
+устройств других пользователей). Сравнивает прямой вызов bcrypt в корутине
+(как было раньше) с проверкой в ограниченном пуле потоков.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from passlib.context import CryptContext
+
+from bot.config import settings
+from bot.users import passwords
+
+
+TICK = 0.01
+
+
+async def _measure_lag(stop, lags):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - started - TICK) * 1000)
+
+
+async def _run(mode, context, password_hash, logins):
+    async def inline_login():
+        return context.verify("password123", password_hash)
+
+    async def executor_login():
+        return (await passwords.verify_password("password123", password_hash))[0]
+
+    login = inline_login if mode == "inline" else executor_login
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(_measure_lag(stop, lags))
+    await asyncio.sleep(TICK * 2)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(logins)))
+    total = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    assert all(results)
+    lags.sort()
+    return {
+        "mode": mode,
+        "total_s": total,
+        "p50_ms": statistics.median(lags),
+        "p95_ms": lags[max(0, int(len(lags) * 0.95) - 1)],
+        "max_ms": lags[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=settings.BCRYPT_ROUNDS)
+    args = parser.parse_args()
+
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.rounds)
+    password_hash = context.hash("password123")
+    passwords.pwd_context = context
+
+    print(f"{args.logins} входов, bcrypt rounds={args.rounds}, потоков: {settings.PASSWORD_HASH_WORKERS}")
+    print(f"{'mode':<9} {'total, s':>9} {'lag p50, ms':>12} {'lag p95, ms':>12} {'lag max, ms':>12}")
+    for mode in ("inline", "executor"):
+        result = asyncio.run(_run(mode, context, password_hash, args.logins))
+        print(
+            f"{result['mode']:<9} {result['total_s']:>9.2f} {result['p50_ms']:>12.1f} "
+            f"{result['p95_ms']:>12.1f} {result['max_ms']:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
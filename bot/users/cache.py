@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+from bot.config import settings
+from bot.db.listener import CACHE_CHANNEL, pg_listener
+from bot.metrics import metrics
+
+
+class UserRecord:
+    """
+    Данные пользователя, нужные хэндлерам (без хэша пароля).
+    """
+
+    __slots__ = ("id", "login", "voice_on")
+
+    def __init__(self, id, login, voice_on):
+        self.id = id
+        self.login = login
+        self.voice_on = voice_on
+
+    @classmethod
+    def from_model(cls, user):
+        return cls(user.id, user.login, user.voice_on)
+
+    def __repr__(self):
+        return f"UserRecord(id={self.id}, login={self.login!r})"
+
+
+# Отметка "tg_id не привязан ни к одному пользователю" - тоже кэшируется
+ANONYMOUS = object()
+
+
+class UserIdentityCache:
+    """
+    Кэш tg_id -> пользователь с вытеснением по LRU и временем жизни записей.
+    Записи UserService сбрасывают кэш по tg_id или по users.id (все сессии пользователя).
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # tg_id -> (истекает, UserRecord | ANONYMOUS)
+        self._data = OrderedDict()
+        # user_id -> {tg_id}
+        self._sessions = {}
+        # Счётчик записей: данные, прочитанные до записи, не сохраняются
+        self._writes = 0
+
+    def _record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.inc("user_cache", result="hit" if hit else "miss")
+        metrics.set("user_cache_hit_ratio", self.hits / (self.hits + self.misses))
+
+    def get(self, tg_id):
+        """
+        UserRecord, ANONYMOUS для незарегистрированного tg_id или None, если записи нет.
+        """
+        with self._lock:
+            item = self._data.get(tg_id)
+            if item is not None and item[0] < time.monotonic():
+                self._drop(tg_id)
+                item = None
+            if item is not None:
+                self._data.move_to_end(tg_id)
+            self._record(item is not None)
+            return item[1] if item is not None else None
+
+    def load_token(self):
+        """
+        Метка, которую нужно взять до чтения из БД и передать в put.
+        """
+        return self._writes
+
+    def put(self, tg_id, user, token):
+        with self._lock:
+            if token != self._writes:
+                # Пока читали из БД, пользователь изменился - запись может быть устаревшей
+                return
+            self._drop(tg_id)
+            self._data[tg_id] = (time.monotonic() + self.ttl, user)
+            if user is not ANONYMOUS:
+                self._sessions.setdefault(user.id, set()).add(tg_id)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+
+    def invalidate_tg(self, tg_id):
+        with self._lock:
+            self._writes += 1
+            self._drop(tg_id)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._writes += 1
+            for tg_id in list(self._sessions.get(user_id, ())):
+                self._drop(tg_id)
+
+    def on_notify(self, payload):
+        """
+        Изменение в БД из другого процесса бота: "users:<user_id>" или "user_sessions:<user_id>:<tg_id>".
+        """
+        table, user_id, *rest = payload.split(":")
+        if table == "users":
+            self.invalidate_user(int(user_id))
+        elif table == "user_sessions":
+            # tg_id мог быть закэширован как анонимный
+            self.invalidate_user(int(user_id))
+            self.invalidate_tg(int(rest[0]))
+
+    def clear(self):
+        with self._lock:
+            self._writes += 1
+            self._data.clear()
+            self._sessions.clear()
+
+    def _drop(self, tg_id):
+        item = self._data.pop(tg_id, None)
+        if item is None or item[1] is ANONYMOUS:
+            return
+        tg_ids = self._sessions.get(item[1].id)
+        if tg_ids is not None:
+            tg_ids.discard(tg_id)
+            if not tg_ids:
+                del self._sessions[item[1].id]
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+user_cache = UserIdentityCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+# Пока подписки не было, изменения других процессов могли быть пропущены
+pg_listener.subscribe(CACHE_CHANNEL, user_cache.on_notify, on_connect=user_cache.clear)
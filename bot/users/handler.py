@@ -18,8 +18,7 @@ async def get_started_message(message: Message):
 
 
 @router.message(Command("start"))
-async def start_handler(message: Message, state: FSMContext):
-    user = await UserService.get_user_by_tg_id(message.from_user.id)
+async def start_handler(message: Message, state: FSMContext, user=None):
 
     if user:
         await message.answer(f"✅ Добро пожаловать, {user.login}!")
@@ -116,9 +115,8 @@ async def register_password_handler(message: Message, state: FSMContext):
 
 # logout
 @router.message(F.text == "🚪 Выйти")
-async def logout_handler(message: Message, state: FSMContext):
+async def logout_handler(message: Message, state: FSMContext, user=None):
     """Выход из аккаунта"""
-    user = await UserService.get_user_by_tg_id(message.from_user.id)
 
     if user:
         await UserService.delete_session(user.id)
@@ -144,7 +142,7 @@ async def change_login_start(message: Message, state: FSMContext):
 
 
 @router.message(AccountStates.entering_new_login)
-async def change_login_confirm(message: Message, state: FSMContext):
+async def change_login_confirm(message: Message, state: FSMContext, user=None):
     """Смена логина"""
     new_login = message.text
 
@@ -153,7 +151,6 @@ async def change_login_confirm(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    user = await UserService.get_user_by_tg_id(message.from_user.id)
     if not user:
         await message.answer("❌ Ошибка: пользователь не найден.")
         await state.clear()
@@ -176,7 +173,7 @@ async def change_password_start(message: Message, state: FSMContext):
 
 
 @router.message(AccountStates.entering_old_password)
-async def change_password_old_check(message: Message, state: FSMContext):
+async def change_password_old_check(message: Message, state: FSMContext, user=None):
     """Проверка старого пароля"""
     old_password = message.text
 
@@ -185,7 +182,6 @@ async def change_password_old_check(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    user = await UserService.get_user_by_tg_id(message.from_user.id)
     if not user:
         await message.answer("❌ Ошибка: пользователь не найден.")
         await state.clear()
@@ -195,13 +191,14 @@ async def change_password_old_check(message: Message, state: FSMContext):
         await message.answer("❌ Неверный пароль. Попробуйте снова.")
         return
 
-    await state.update_data(old_password=old_password)
+    # Состояние хранится в БД: сам пароль туда не попадает, только отметка о проверке
+    await state.update_data(password_confirmed=True)
     await state.set_state(AccountStates.entering_new_password)
     await message.answer("✅ Старый пароль подтвержден. Теперь введите новый пароль:")
 
 
 @router.message(AccountStates.entering_new_password)
-async def change_password_confirm(message: Message, state: FSMContext):
+async def change_password_confirm(message: Message, state: FSMContext, user=None):
     """Изменение пароля"""
     new_password = message.text
 
@@ -211,15 +208,13 @@ async def change_password_confirm(message: Message, state: FSMContext):
         return
 
     data = await state.get_data()
-    old_password = data.get("old_password")
 
-    user = await UserService.get_user_by_tg_id(message.from_user.id)
-    if not user:
+    if not user or not data.get("password_confirmed"):
         await message.answer("❌ Ошибка: пользователь не найден.")
         await state.clear()
         return
 
-    success = await UserService.change_password(user.id, old_password, new_password)
+    success = await UserService.set_password(user.id, new_password)
     if success:
         await message.answer("✅ Пароль успешно изменен!", reply_markup=await get_account_keyboard(message.from_user.id))
     else:
@@ -0,0 +1,50 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from bot.config import settings
+from bot.metrics import metrics
+
+
+# Хэши с другой стоимостью (BCRYPT_ROUNDS) считаются устаревшими и пересчитываются при входе
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+# bcrypt отпускает GIL, поэтому хэширование в потоках не блокирует цикл событий.
+# Семафор ограничивает число одновременных вычислений: остальные ждут в цикле событий
+# (ожидание можно отменить), а не в неограниченной очереди пула.
+_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_semaphore = None
+
+
+async def _run(op, func, *args):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS)
+
+    async with _semaphore:
+        started = time.perf_counter()
+        result = await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+        metrics.observe("password_hash_seconds", time.perf_counter() - started, op=op)
+        return result
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", pwd_context.hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> tuple[bool, str | None]:
+    """
+    Проверяет пароль. Возвращает (верен ли пароль, новый хэш или None).
+    Новый хэш возвращается, если пароль верен, а хэш посчитан с устаревшей стоимостью.
+    """
+    valid, new_hash = await _run("verify", pwd_context.verify_and_update, password, password_hash)
+    if new_hash is not None:
+        metrics.inc("password_rehashed")
+    return valid, new_hash
@@ -1,51 +1,74 @@
 from sqlalchemy import insert, select, exists, update, delete
-from passlib.hash import bcrypt
 
 from bot.db.service import BaseService
 from bot.users.model import User, UserSession
-from bot.db.base import async_session_maker
+from bot.db.base import commit, has_pending_writes, on_commit, use_session
+from bot.devices.cache import device_cache
+from bot.users.cache import ANONYMOUS, UserRecord, user_cache
+from bot.users import passwords
 
 
 class UserService(BaseService):
     model = User
 
     @staticmethod
-    async def user_exists(login: str) -> bool:
-        async with async_session_maker() as session:
+    async def user_exists(login: str, session=None) -> bool:
+        async with use_session(session) as session:
             query = select(exists().where(User.login == login))
             result = await session.execute(query)
             return result.scalar()
 
     @staticmethod
-    async def verify_password(login: str, password: str) -> bool:
-        async with async_session_maker() as session:
+    async def verify_password(login: str, password: str, session=None) -> bool:
+        async with use_session(session) as session:
             query = select(User).filter_by(login=login)
             result = await session.execute(query)
             user = result.scalar_one_or_none()
-            return user and bcrypt.verify(password, user.password)
+            if not user:
+                return False
+
+            valid, new_hash = await passwords.verify_password(password, user.password)
+            if new_hash is not None:
+                # Хэш посчитан с прежней стоимостью - заменяем, пока известен пароль
+                await session.execute(update(User).where(User.id == user.id).values(password=new_hash))
+                await commit(session)
+            return valid
 
     @staticmethod
-    async def create_user(login: str, password: str, tg_id: int):
-        async with async_session_maker() as session:
-            new_user = User(login=login, password=bcrypt.hash(password))
+    async def create_user(login: str, password: str, tg_id: int, session=None):
+        password_hash = await passwords.hash_password(password)
+        async with use_session(session) as session:
+            new_user = User(login=login, password=password_hash)
             session.add(new_user)
             await session.flush()
 
             new_device = UserSession(user_id=new_user.id, tg_id=tg_id)
             session.add(new_device)
 
-            await session.commit()
+            await commit(session)
+            on_commit(session, user_cache.invalidate_tg, tg_id)
 
     @staticmethod
-    async def get_user_by_tg_id(tg_id: int):
-        async with async_session_maker() as session:
+    async def get_user_by_tg_id(tg_id: int, session=None) -> UserRecord | None:
+        cached = not has_pending_writes(session)
+        user = user_cache.get(tg_id) if cached else None
+        if user is not None:
+            return None if user is ANONYMOUS else user
+
+        token = user_cache.load_token()
+        async with use_session(session) as session:
             query = select(User).join(UserSession).filter(UserSession.tg_id == tg_id)
             result = await session.execute(query)
-            return result.scalar_one_or_none()
+            user = result.scalar_one_or_none()
+
+        user = UserRecord.from_model(user) if user else None
+        if cached:
+            user_cache.put(tg_id, user or ANONYMOUS, token)
+        return user
 
     @staticmethod
-    async def add_device_to_user(login: str, tg_id: int):
-        async with async_session_maker() as session:
+    async def add_device_to_user(login: str, tg_id: int, session=None):
+        async with use_session(session) as session:
             query = select(User).filter_by(login=login)
             result = await session.execute(query)
             user = result.scalar_one_or_none()
@@ -53,47 +76,63 @@ class UserService(BaseService):
             if user:
                 new_device = UserSession(user_id=user.id, tg_id=tg_id)
                 session.add(new_device)
-                await session.commit()
+                await commit(session)
+                on_commit(session, user_cache.invalidate_tg, tg_id)
 
     @staticmethod
-    async def change_login(user_id: int, new_login: str) -> bool:
-        async with async_session_maker() as session:
-            if await UserService.user_exists(new_login):
+    async def change_login(user_id: int, new_login: str, session=None) -> bool:
+        async with use_session(session) as session:
+            if await UserService.user_exists(new_login, session):
                 return False  # Логин уже занят
 
             query = update(User).where(User.id == user_id).values(login=new_login)
             await session.execute(query)
-            await session.commit()
+            await commit(session)
+            on_commit(session, user_cache.invalidate_user, user_id)
             return True
 
     @staticmethod
-    async def change_password(user_id: int, old_psw: str, new_psw: str) -> bool:
-        async with async_session_maker() as session:
+    async def change_password(user_id: int, old_psw: str, new_psw: str, session=None) -> bool:
+        async with use_session(session) as session:
             query = select(User).where(User.id == user_id)
             result = await session.execute(query)
             user = result.scalar_one_or_none()
 
-            if not user or not bcrypt.verify(old_psw, user.password):
+            if not user or not (await passwords.verify_password(old_psw, user.password))[0]:
                 return False
 
-            query = update(User).where(User.id == user_id).values(password=bcrypt.hash(new_psw))
+            query = update(User).where(User.id == user_id).values(password=await passwords.hash_password(new_psw))
             await session.execute(query)
-            await session.commit()
+            await commit(session)
             return True
 
     @staticmethod
-    async def delete_session(user_id: int):
-        async with async_session_maker() as session:
+    async def set_password(user_id: int, new_psw: str, session=None) -> bool:
+        """
+        Меняет пароль без проверки старого (старый проверен на предыдущем шаге диалога).
+        """
+        async with use_session(session) as session:
+            query = update(User).where(User.id == user_id).values(password=await passwords.hash_password(new_psw))
+            result = await session.execute(query)
+            await commit(session)
+            return result.rowcount > 0
+
+    @staticmethod
+    async def delete_session(user_id: int, session=None):
+        async with use_session(session) as session:
             query = delete(UserSession).where(UserSession.user_id == user_id)
             await session.execute(query)
-            await session.commit()
+            await commit(session)
+            on_commit(session, device_cache.forget_sessions, user_id)
+            on_commit(session, user_cache.invalidate_user, user_id)
 
     @staticmethod
-    async def change_voice_on(tg_id: int, change: bool):
-        async with async_session_maker() as session:
+    async def change_voice_on(tg_id: int, change: bool, session=None):
+        async with use_session(session) as session:
             query = select(User).join(UserSession).filter(UserSession.tg_id == tg_id)
             result = await session.execute(query)
             user = result.scalars().first()
 
             user.voice_on = change
-            await session.commit()
+            await commit(session)
+            on_commit(session, user_cache.invalidate_user, user.id)
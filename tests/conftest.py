@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def run():
+    """
+    Выполняет корутину теста в новом цикле событий. Тесты работают с Postgres из настроек бота
+    (переменные DB_* или .env, схема на последней миграции) и пропускаются, если БД недоступна.
+    """
+    try:
+        from bot.db.base import engine
+    except Exception as e:
+        pytest.skip(f"Нет настроек бота: {e}")
+
+    async def check():
+        try:
+            async with engine.connect():
+                pass
+        except (OSError, ConnectionError) as e:
+            pytest.skip(f"Postgres недоступен: {e}")
+        finally:
+            await engine.dispose()
+
+    asyncio.run(check())
+
+    async def with_dispose(coro):
+        try:
+            return await coro
+        finally:
+            # Соединения пула привязаны к циклу событий теста
+            await engine.dispose()
+
+    return lambda coro: asyncio.run(with_dispose(coro))
+
+
+@pytest.fixture
+def unit_of_work():
+    """
+    Фабрика сессии unit of work: commit сервисов только отправляет изменения, в конце теста - откат.
+    """
+    from bot.db.base import async_session_maker
+
+    return lambda: async_session_maker(info={"unit_of_work": True, "on_commit": []})
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+device_index = pytest.importorskip("bot.AI.device_index")
+
+DEVICES = [
+    {"id": 1, "type": "Свет на кухне", "params": {"condition": "OFF"}},
+    {"id": 2, "type": "Свет в спальне", "params": {"condition": "OFF"}},
+    {"id": 3, "type": "Кондиционер", "params": {"condition": "OFF"}},
+]
+
+
+async def encode(descriptions):
+    # Векторы устройств - оси пространства: сходство запроса с устройством задаётся его координатами
+    return np.eye(len(DEVICES), dtype=np.float32)[:len(descriptions)]
+
+
+def vector(*coordinates):
+    vector = np.array(coordinates, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def assign(queries, vectors):
+    index = device_index.DeviceEmbeddingIndex()
+    return asyncio.run(index.assign("test", queries, np.stack(vectors), DEVICES, encode))
+
+
+def test_phrasings_of_one_device_share_it():
+    # Второй запрос ближе к свету на кухне, хотя и свет в спальне уступает ему немного
+    assert assign(
+        ["свет на кухне", "кухонный свет"],
+        [vector(0.9, 0.3, 0.0), vector(0.72, 0.69, 0.0)],
+    ) == [0, 0]
+
+
+def test_ambiguous_top1_moves_to_free_device():
+    # Второй запрос почти одинаково похож на оба светильника, а кухонный занят первым
+    assert assign(
+        ["свет на кухне", "свет в спальне"],
+        [vector(0.9, 0.3, 0.0), vector(0.71, 0.70, 0.0)],
+    ) == [0, 1]
+
+
+def test_same_queries_get_same_device():
+    assert assign(
+        ["кондиционер", "Кондиционер "],
+        [vector(0.1, 0.0, 0.9), vector(0.1, 0.0, 0.9)],
+    ) == [2, 2]
+
+
+def test_state_changes_do_not_reencode():
+    encoded = []
+
+    async def counting_encode(descriptions):
+        encoded.extend(descriptions)
+        return await encode(descriptions)
+
+    async def check():
+        index = device_index.DeviceEmbeddingIndex()
+        await index.matrix("test", DEVICES, counting_encode)
+        toggled = [{**DEVICES[0], "params": {"condition": "ON"}}, *DEVICES[1:]]
+        await index.matrix("test", toggled, counting_encode)
+        renamed = [{**DEVICES[0], "type": "Свет в гостиной"}, *DEVICES[1:]]
+        await index.matrix("test", renamed, counting_encode)
+
+    asyncio.run(check())
+    assert len(encoded) == len(DEVICES) + 1
+
+
+def test_least_recent_scopes_are_evicted():
+    async def check():
+        index = device_index.DeviceEmbeddingIndex(max_scopes=2)
+        for scope in ("first", "second"):
+            await index.matrix(scope, DEVICES, encode)
+        await index.matrix("first", DEVICES, encode)
+        await index.matrix("third", DEVICES, encode)
+        return index
+
+    index = asyncio.run(check())
+    assert list(index._rows) == ["first", "third"]
+    assert set(index._matrices) == {"first", "third"}
+    assert all(scopes == {"first", "third"} for scopes in index._owners.values())
@@ -0,0 +1,54 @@
+import pytest
+
+fast_path = pytest.importorskip("bot.AI.fast_path")
+
+DEVICES = [
+    {"id": 1, "type": "Кондиционер", "params": {"condition": "ON", "temperature": "22"}},
+    {"id": 2, "type": "Телевизор", "params": {"condition": "ON", "volume": "20", "channel": "1"}},
+    {"id": 3, "type": "Люстра", "params": {"condition": "OFF", "brightness": "40"}},
+    {"id": 4, "type": "Свет в спальне", "params": {"condition": "OFF"}},
+    {"id": 5, "type": "Свет на кухне", "params": {"condition": "OFF"}},
+]
+
+
+def parsed(text):
+    command = fast_path.parse_command(text, DEVICES)
+    return command and (command["device"], command["command"], command["value"])
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("уменьши громкость телевизора на 10", ("Телевизор", "volume", "10")),
+    ("увеличь громкость телевизора на 5", ("Телевизор", "volume", "25")),
+    ("подними температуру кондиционера на 2 градуса", ("Кондиционер", "temperature", "24")),
+    ("опусти температуру кондиционера на 1,5", ("Кондиционер", "temperature", "20.5")),
+])
+def test_relative_commands_change_current_value(text, expected):
+    assert parsed(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("поставь громкость телевизора на 10", ("Телевизор", "volume", "10")),
+    ("установи температуру кондиционера 18 градусов", ("Кондиционер", "temperature", "18")),
+    ("сделай яркость люстры 70 процентов", ("Люстра", "brightness", "70")),
+    ("выключи кондиционер", ("Кондиционер", "condition", "OFF")),
+    ("включи свет на кухне", ("Свет на кухне", "condition", "ON")),
+])
+def test_absolute_commands(text, expected):
+    assert parsed(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "увеличь громкость телевизора",
+    "включи кондиционер на 22",
+    "выключи люстру через 10 минут",
+    "включи люстру на 50%",
+    "включи свет",
+    "не включай телевизор",
+])
+def test_ambiguous_commands_fall_back_to_llm(text):
+    assert parsed(text) is None
+
+
+def test_relative_command_on_non_numeric_value_falls_back():
+    devices = [{"id": 1, "type": "Телевизор", "params": {"volume": "max"}}]
+    assert fast_path.parse_command("увеличь громкость телевизора на 5", devices) is None
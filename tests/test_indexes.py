@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event, text
+
+
+USERS = 20000
+DEVICES_PER_USER = 10
+TG_OFFSET = 9_000_000_000
+
+SEED = [
+    "INSERT INTO devices (type, params) VALUES ('index-test-lamp', '{}')",
+    f"""
+    INSERT INTO users (login, password, voice_on)
+    SELECT 'index-test-' || g, 'x', false FROM generate_series(1, {USERS}) g
+    """,
+    f"""
+    INSERT INTO user_sessions (tg_id, user_id)
+    SELECT {TG_OFFSET} + id, id FROM users WHERE login LIKE 'index-test-%'
+    """,
+    f"""
+    INSERT INTO user_devices (user_id, device_id, name, params)
+    SELECT u.id, d.id, 'device ' || g, '{{"condition": "OFF"}}'
+    FROM users u, devices d, generate_series(1, {DEVICES_PER_USER}) g
+    WHERE u.login LIKE 'index-test-%' AND d.type = 'index-test-lamp'
+    """,
+    "ANALYZE users, user_sessions, user_devices",
+]
+
+
+async def seed(session):
+    for statement in SEED:
+        await session.execute(text(statement))
+    return (await session.execute(text(
+        "SELECT id FROM users WHERE login = 'index-test-1'"
+    ))).scalar_one()
+
+
+@contextmanager
+def captured_queries(session):
+    """
+    SQL и параметры запросов, отправленных в БД внутри блока.
+    """
+    queries = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        queries.append((statement, parameters))
+
+    engine = session.bind.sync_engine
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+async def explain(session, statement, parameters):
+    # EXPLAIN с параметрами запроса через драйвер: план тот же, что у запроса сервиса
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    rows = await raw.driver_connection.fetch(f"EXPLAIN {statement}", *parameters)
+    return "\n".join(row[0] for row in rows)
+
+
+def assert_index_scans(plan, *tables):
+    for table in tables:
+        assert f"Seq Scan on {table}" not in plan, plan
+    assert "Index" in plan, plan
+
+
+def test_get_user_devices_uses_indexes(run, unit_of_work):
+    # Модули бота читают настройки при импорте: импортируем после проверки БД в run
+    from bot.devices.cache import device_cache
+    from bot.devices.service import DeviceService
+
+    async def check():
+        async with unit_of_work() as session:
+            user_id = await seed(session)
+            device_cache.clear()
+            try:
+                with captured_queries(session) as queries:
+                    devices = await DeviceService.get_user_devices(TG_OFFSET + user_id, session)
+            finally:
+                device_cache.clear()
+            assert len(devices) == DEVICES_PER_USER
+            assert len(queries) == 1
+            assert_index_scans(await explain(session, *queries[0]), "user_sessions", "user_devices")
+            await session.rollback()
+
+    run(check())
+
+
+def test_delete_session_uses_index(run, unit_of_work):
+    from bot.users.service import UserService
+
+    async def check():
+        async with unit_of_work() as session:
+            user_id = await seed(session)
+            with captured_queries(session) as queries:
+                await UserService.delete_session(user_id, session)
+            deletes = [query for query in queries if query[0].lstrip().upper().startswith("DELETE")]
+            assert len(deletes) == 1
+            assert_index_scans(await explain(session, *deletes[0]), "user_sessions")
+            await session.rollback()
+
+    run(check())
@@ -0,0 +1,85 @@
+import json
+
+from sqlalchemy import text
+
+
+async def seed():
+    from bot.db.base import async_session_maker
+
+    async with async_session_maker() as session:
+        device_id = (await session.execute(text(
+            "INSERT INTO devices (type, params) VALUES ('journal-test-lamp', '{}') RETURNING id"
+        ))).scalar_one()
+        user_id = (await session.execute(text(
+            "INSERT INTO users (login, password, voice_on) VALUES ('journal-test', 'x', false) RETURNING id"
+        ))).scalar_one()
+        rows = await session.execute(text("""
+            INSERT INTO user_devices (user_id, device_id, name, params) VALUES
+                (:user_id, :device_id, 'lamp', '{"condition": "OFF", "brightness": "50"}'),
+                (:user_id, :device_id, 'strip', '{"condition": "ON", "color": "red"}')
+            RETURNING id
+        """), {"user_id": user_id, "device_id": device_id})
+        ids = [row[0] for row in rows]
+        await session.commit()
+    return user_id, device_id, ids
+
+
+async def cleanup(user_id, device_id):
+    from bot.db.base import async_session_maker
+
+    async with async_session_maker() as session:
+        await session.execute(text("DELETE FROM user_devices WHERE user_id = :id"), {"id": user_id})
+        await session.execute(text("DELETE FROM users WHERE id = :id"), {"id": user_id})
+        await session.execute(text("DELETE FROM devices WHERE id = :id"), {"id": device_id})
+        await session.commit()
+
+
+async def params_of(ids):
+    from bot.db.base import async_session_maker
+
+    async with async_session_maker() as session:
+        rows = await session.execute(
+            text("SELECT id, params FROM user_devices WHERE id = ANY(:ids)"), {"ids": ids}
+        )
+        return dict(rows.all())
+
+
+def write_segment(path, records, tail=""):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records) + tail, encoding="utf-8")
+
+
+def test_recover_replays_journal(run, tmp_path):
+    # Модули бота читают настройки при импорте: импортируем после проверки БД в run
+    from bot.devices.state_store import DeviceStateStore
+
+    async def check():
+        user_id, device_id, (lamp, strip) = await seed()
+        try:
+            write_segment(tmp_path / "journal.000000000001", [
+                {"id": lamp, "patch": {"condition": "ON"}, "replace": False},
+                {"id": strip, "patch": {"condition": "OFF"}, "replace": True},
+            ])
+            # Процесс упал посреди записи: последняя строка недописана
+            write_segment(tmp_path / "journal.000000000002", [
+                {"id": lamp, "patch": {"brightness": "70"}, "replace": False},
+                {"id": strip, "patch": {"brightness": "10"}, "replace": False},
+            ], tail='{"id": %d, "patch": {"condi' % lamp)
+
+            store = DeviceStateStore("write_behind", 1, 100, "journal", str(tmp_path))
+            assert await store.recover() == 2
+
+            params = await params_of([lamp, strip])
+            assert params[lamp] == {"condition": "ON", "brightness": "70"}
+            assert params[strip] == {"condition": "OFF", "brightness": "10"}
+            assert not list(tmp_path.iterdir())
+
+            # Повторный запуск: журнал уже применён
+            assert await store.recover() == 0
+            # Новые записи идут в сегмент после восстановленных
+            store.apply(lamp, {"condition": "OFF"})
+            assert [path.name for path in tmp_path.iterdir()] == ["journal.000000000003"]
+            await store.close()
+        finally:
+            await cleanup(user_id, device_id)
+
+    run(check())